@@ -1,38 +1,98 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from flask_socketio import SocketIO
 from dotenv import load_dotenv
-from pymongo import MongoClient, DESCENDING
+
+# Green-thread mode has to patch the standard library before pymongo, requests and
+# threading are imported, so .env is loaded and ASYNC_MODE read here, once for both.
+load_dotenv()
+ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, Response
+from flask_socketio import SocketIO, join_room
+import click
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, InsertOne, ReplaceOne, DeleteOne, DeleteMany, ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
 from functools import wraps
+import atexit
 import time
 import hmac
 import hashlib
-from threading import Thread, Lock
-from datetime import datetime
+import json
+import re
+from threading import Lock, Event
+from datetime import datetime, timedelta
 import random
 import math
+import heapq
 import requests # Used for Cashfree API calls
 from flask_talisman import Talisman # Added for security headers
 import sentry_sdk # Added for error monitoring
 from sentry_sdk.integrations.flask import FlaskIntegration # Added for error monitoring
+from cashfree import CashfreeClient, CircuitBreaker
+from indexes import ensure_indexes, verify_query_plans
+from ledger import LedgerWriter
+from metrics import Registry, MongoCommandMetrics
+from presets import PresetQueue
+from user_cache import UserCache
+from round_engine import RoundLease, RoundStateChannel, RoundEngine, RecentResults
+from wallet import WalletService
+import wire
 
 # --- Basic Setup ---
-load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a_fallback_secret_key')
 app.static_folder = 'static'
-socketio = SocketIO(app, async_mode='threading')
+app.config['ASYNC_MODE'] = ASYNC_MODE
+# A message queue lets any worker (or a settlement/webhook running elsewhere) emit to
+# sockets connected to other workers. Use redis://host:6379/0 in production (needs the
+# 'redis' package) or memory:// (kombu) as an in-process stand-in for local testing.
+# SOCKETIO_WIRE_FORMAT=compact switches Socket.IO to msgpack (needs the 'msgpack' package)
+# and sends the high-frequency game events in the positional form from wire.py.
+app.config['SOCKETIO_WIRE_FORMAT'] = os.getenv('SOCKETIO_WIRE_FORMAT', 'json')
+COMPACT_WIRE = app.config['SOCKETIO_WIRE_FORMAT'] == 'compact'
+socketio = SocketIO(app, async_mode=app.config['ASYNC_MODE'], message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE'),
+                    **({'serializer': 'msgpack'} if COMPACT_WIRE else {}))
+
+@app.context_processor
+def inject_socketio_client():
+    # The msgpack build of the client bundles the matching parser.
+    bundle = 'socket.io.msgpack.min.js' if COMPACT_WIRE else 'socket.io.min.js'
+    return {'socketio_client_url': f"https://cdn.socket.io/4.7.5/{bundle}"}
 
 # --- Security & Error Monitoring Setup ---
 
+# Sentry trace sampling per route: the hot game endpoints are sampled lightly and
+# everything else at SENTRY_TRACES_SAMPLE_RATE. SENTRY_ROUTE_SAMPLE_RATES adds or
+# overrides path-prefix rates as JSON, e.g. {"/bet": 0.05}.
+SENTRY_TRACES_SAMPLE_RATE = float(os.getenv('SENTRY_TRACES_SAMPLE_RATE', 1.0))
+SENTRY_ROUTE_SAMPLE_RATES = {
+    '/bet': 0.01,
+    '/api/aviator/': 0.01,
+    '/socket.io': 0.0,
+    '/static/': 0.0,
+    '/metrics': 0.0,
+    **json.loads(os.getenv('SENTRY_ROUTE_SAMPLE_RATES', '{}'))
+}
+
+def sentry_traces_sampler(sampling_context):
+    if sampling_context.get('parent_sampled') is not None:
+        return float(sampling_context['parent_sampled'])
+    path = sampling_context.get('wsgi_environ', {}).get('PATH_INFO', '')
+    matches = [prefix for prefix in SENTRY_ROUTE_SAMPLE_RATES if path.startswith(prefix)]
+    if matches:
+        return SENTRY_ROUTE_SAMPLE_RATES[max(matches, key=len)]
+    return SENTRY_TRACES_SAMPLE_RATE
+
 # Sentry for error monitoring in production
 if os.getenv('FLASK_ENV') == 'production':
     sentry_sdk.init(
         dsn=os.getenv('SENTRY_DSN'),
         integrations=[FlaskIntegration()],
-        traces_sample_rate=1.0
+        traces_sampler=sentry_traces_sampler
     )
 
 # Talisman for security headers
@@ -86,39 +146,92 @@ app.config['CASHFREE_API_VERSION'] = '2022-09-01'
 # NOTE: CASHFREE_WEBHOOK_SECRET is removed as it's not used for verification. The API Secret Key is used instead.
 
 # URL is now set to the live production environment.
-CASHFREE_API_URL = "https://api.cashfree.com/pg"
+CASHFREE_API_URL = os.getenv('CASHFREE_API_URL', "https://api.cashfree.com/pg")
+
+# One pooled client per process so deposits reuse the TLS connection to the gateway.
+cashfree_client = CashfreeClient(
+    CASHFREE_API_URL,
+    app.config['CASHFREE_CLIENT_ID'],
+    app.config['CASHFREE_CLIENT_SECRET'],
+    app.config['CASHFREE_API_VERSION'],
+    connect_timeout=float(os.getenv('CASHFREE_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.getenv('CASHFREE_READ_TIMEOUT', 10)),
+    max_retries=int(os.getenv('CASHFREE_MAX_RETRIES', 2)),
+    breaker=CircuitBreaker(threshold=int(os.getenv('CASHFREE_BREAKER_THRESHOLD', 5)), reset_timeout=float(os.getenv('CASHFREE_BREAKER_RESET', 30)))
+)
+
+
+# --- Metrics ---
+# Per-worker Prometheus histograms, served at /metrics.
+metrics = Registry()
+request_latency = metrics.histogram('gamehub_request_seconds', 'HTTP request latency by route.', ('route', 'method'))
+settlement_duration = metrics.histogram('gamehub_settlement_seconds', 'Round settlement duration by game.', ('game',))
+aviator_tick_jitter = metrics.histogram('gamehub_aviator_tick_jitter_seconds', 'How late each aviator tick ran versus its schedule.',
+                                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+emit_duration = metrics.histogram('gamehub_socketio_emit_seconds', 'Socket.IO emit duration by event.', ('event',))
+mongo_latency = metrics.histogram('gamehub_mongo_command_seconds', 'MongoDB command latency by command and collection.', ('command', 'collection'))
+metrics.gauge('gamehub_socket_room_subscribers', 'Sockets subscribed to each game room on this worker.',
+              lambda: {(room,): count for room, count in room_subscriber_counts().items()}, labelnames=('room',))
+metrics.gauge('gamehub_user_cache_hit_ratio', 'User cache hits over lookups.', lambda: user_cache.stats()['hit_rate'])
+metrics.gauge('gamehub_user_cache_served_age_max_seconds', 'Oldest cache entry served since start.', lambda: user_cache.stats()['served_age_max_seconds'])
+metrics.gauge('gamehub_user_cache_entries', 'Entries in the user cache.', lambda: user_cache.stats()['size'])
+# Must be registered before the MongoClient is created.
+monitoring.register(MongoCommandMetrics(mongo_latency))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe(time.perf_counter() - started, route=route, method=request.method)
+    return response
+
+def emit(event, data, **kwargs):
+    """socketio.emit, timed per event, in the compact encoding when that is enabled."""
+    with emit_duration.time(event=event):
+        socketio.emit(event, wire.encode(event, data) if COMPACT_WIRE else data, **kwargs)
 
 
 # --- Database Connection ---
-try:
-    mongo_uri = os.getenv('MONGO_URI')
-    client = MongoClient(mongo_uri)
-    db = client['xdhamaka_db']
-    users_collection = db['users']
-    bets_collection = db['bets']
-    games_collection = db['games']
-    admins_collection = db['admins']
-    withdrawals_collection = db['withdrawals']
-    aviator_games_collection = db['aviator_games']
-    aviator_bets_collection = db['aviator_bets']
-    preset_results_collection = db['preset_results']
-    transactions_collection = db['transactions']
-    print("✅ Successfully connected to MongoDB.")
-
-    # Create Database Indexes for Performance
-    transactions_collection.create_index([("user_id", 1)])
-    transactions_collection.create_index([("timestamp", -1)])
-    transactions_collection.create_index([("type", 1)])
-    # Unique index to prevent processing the same payment webhook twice
-    transactions_collection.create_index([("associated_id", 1)], unique=True, sparse=True)
-    withdrawals_collection.create_index([("user_id", 1)])
-    withdrawals_collection.create_index([("status", 1)])
-    withdrawals_collection.create_index([("requested_at", -1)])
-    users_collection.create_index([("mobile", 1)], unique=True)
-    games_collection.create_index([("timestamp", -1)])
-    aviator_games_collection.create_index([("timestamp", -1)])
-    print("✅ Database indexes ensured.")
+# The client connects on first use, so importing the app (gunicorn workers, CLI
+# commands) does no network I/O. Indexes and the admin seed are `flask migrate`.
+mongo_uri = os.getenv('MONGO_URI')
+client = MongoClient(mongo_uri, connect=False)
+db = client[os.getenv('MONGO_DB', 'xdhamaka_db')]
+users_collection = db['users']
+bets_collection = db['bets']
+games_collection = db['games']
+admins_collection = db['admins']
+withdrawals_collection = db['withdrawals']
+aviator_games_collection = db['aviator_games']
+aviator_bets_collection = db['aviator_bets']
+preset_results_collection = db['preset_results']
+transactions_collection = db['transactions']
+rollups_collection = db['financial_rollups']
+leases_collection = db['leases']
+round_state_collection = db['round_state']
+webhook_inbox_collection = db['webhook_inbox']
+bet_pools_collection = db['bet_pools']
+# Profile fields read by the game pages and payment routes, through user_cache.get().
+user_cache = UserCache(
+    users_collection,
+    fields=('name', 'email', 'mobile', 'status', 'wallet.balance'),
+    ttl=float(os.getenv('USER_CACHE_TTL', 30)),
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+    shared=os.getenv('MULTI_WORKER', 'false').lower() == 'true',
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+wallet = WalletService(users_collection, cache=user_cache)
 
+def bootstrap_database():
+    """Creates the indexes declared in indexes.py and seeds the default admin. Run once per deploy."""
+    ensure_indexes(db)
+    print("✅ Database indexes ensured.")
 
     if admins_collection.count_documents({}) == 0:
         admins_collection.insert_one({
@@ -127,15 +240,34 @@ try:
         })
         print("✅ Default admin user created. Username: admin, Password: password")
 
-except Exception as e:
-    print(f"❌ Could not connect to MongoDB. Error: {e}")
+
+# --- Ledger Writer ---
+# With LEDGER_WRITE_BEHIND=true, transactions are journaled locally and flushed to
+# Mongo in batches instead of one insert_one per money-moving request.
+# LEDGER_JOURNAL_PATH is a prefix: each worker journals to <path>.<host>-<pid>.
+ledger_writer = LedgerWriter(
+    transactions_collection,
+    on_written=lambda docs: rollup_transactions(docs),
+    journal_path=os.getenv('LEDGER_JOURNAL_PATH', 'ledger_journal.jsonl'),
+    max_batch=int(os.getenv('LEDGER_MAX_BATCH', 500)),
+    max_delay=float(os.getenv('LEDGER_MAX_DELAY', 0.5)),
+    enabled=os.getenv('LEDGER_WRITE_BEHIND', 'false').lower() == 'true'
+)
+
+
+# --- Multi-Worker Setup ---
+# Set MULTI_WORKER=true when running more than one process. Exactly one worker holds
+# the round engine lease and runs the loops; the rest read round state from the channel.
+app.config['MULTI_WORKER'] = os.getenv('MULTI_WORKER', 'false').lower() == 'true'
 
 
 # --- Game State & Settings with Locks ---
 game_state_lock = Lock()
 game_state = {
-    "timer": 30,
-    "round_id": None
+    "phase": "settled",
+    "round_id": None,
+    "locks_at": 0,
+    "ends_at": 0
 }
 
 aviator_state_lock = Lock()
@@ -149,19 +281,165 @@ aviator_game_state = {
 }
 AVIATOR_WAIT_TIME = 10
 AVIATOR_BREAK_TIME = 5
+AVIATOR_TICK_INTERVAL = 0.1
+# 'local': clients draw the curve from the flight start and only get low-rate checkpoints.
+# 'ticks': the server emits every multiplier tick (legacy behaviour).
+AVIATOR_CURVE_MODE = os.getenv('AVIATOR_CURVE_MODE', 'local')
+AVIATOR_CHECKPOINT_INTERVAL = float(os.getenv('AVIATOR_CHECKPOINT_INTERVAL', 1.0))
+COLOR_PAYOUTS = {"red": 2, "green": 2, "violet": 9}
+COLOR_ROUND_TIME = 30
+COLOR_LOCK_TIME = 5  # betting closes when this many seconds are left
+COLOR_BREAK_TIME = 5
+COLOR_POOL_INTERVAL = 1
+
+
+# Round state as seen by request handlers. The leader publishes its loop state here
+# after every change; other workers receive it through the shared channel.
+round_channel = RoundStateChannel(round_state_collection, shared=app.config['MULTI_WORKER'])
+
+def get_color_state():
+    return round_channel.get('color', {"phase": "settled", "round_id": None, "locks_at": 0, "ends_at": 0})
+
+def get_aviator_state():
+    return round_channel.get('aviator', {"status": "crashed", "round_id": None})
+
+recent_results = {
+    'color': RecentResults(games_collection),
+    'aviator': RecentResults(aviator_games_collection),
+}
+
+def record_result(game, result):
+    """Adds a finished round to the game's buffer and shares the buffer with follower workers."""
+    recent_results[game].add(result)
+    if round_channel.shared:
+        round_channel.publish(f"{game}_results", {'results': recent_results[game].latest()})
+
+def get_recent_results(game):
+    """The last rounds of a game, newest first, without a database read. Followers in a
+    multi-worker deployment use the copy the leader published with the round state."""
+    if round_channel.shared and not (round_engine and round_engine.is_leader()):
+        published = round_channel.get(f"{game}_results").get('results')
+        if published is not None:
+            return published
+    return recent_results[game].latest()
 
 
 # --- Helper Functions ---
-def log_transaction(user_id, amount, type, description, associated_id=None):
-    """Logs a financial transaction to the database."""
-    transactions_collection.insert_one({
+def build_transaction(user_id, amount, type, description, associated_id=None):
+    """Builds a transaction document without writing it."""
+    return {
+        "_id": ObjectId(),
         "user_id": user_id,
         "amount": amount,
         "type": type,
         "description": description,
         "associated_id": associated_id,
         "timestamp": datetime.now()
-    })
+    }
+
+def log_transaction(user_id, amount, type, description, associated_id=None):
+    """Logs a financial transaction to the database."""
+    ledger_writer.write([build_transaction(user_id, amount, type, description, associated_id)])
+
+def apply_rollup_increments(increments):
+    """Adds {day: {field: value}} increments to the per-day and all-time rollup documents."""
+    all_time = {}
+    operations = []
+    for day, inc in increments.items():
+        operations.append(UpdateOne({'_id': f"day:{day}"}, {'$inc': inc, '$set': {'date': day}}, upsert=True))
+        for field, value in inc.items():
+            all_time[field] = all_time.get(field, 0) + value
+    if operations:
+        operations.append(UpdateOne({'_id': 'all'}, {'$inc': all_time}, upsert=True))
+        rollups_collection.bulk_write(operations, ordered=False)
+
+def rollup_transactions(transactions):
+    """Folds transaction documents into the rollup counters, keyed by transaction type."""
+    increments = {}
+    for t in transactions:
+        inc = increments.setdefault(t['timestamp'].strftime('%Y-%m-%d'), {})
+        inc[f"totals.{t['type']}"] = inc.get(f"totals.{t['type']}", 0) + t['amount']
+        inc[f"counts.{t['type']}"] = inc.get(f"counts.{t['type']}", 0) + 1
+    apply_rollup_increments(increments)
+
+def rollup_withdrawal_status(status, amount, count=1):
+    """Counts withdrawals moving to a final status (approved/rejected)."""
+    day = datetime.now().strftime('%Y-%m-%d')
+    apply_rollup_increments({day: {f"totals.withdrawals_{status}": amount, f"counts.withdrawals_{status}": count}})
+
+# Today and yesterday still take live increments (write-behind flushes lag a little
+# past midnight), so a normal rebuild leaves their documents alone.
+ROLLUP_OPEN_DAYS = 2
+
+def rebuild_rollups(include_open_days=False):
+    """Recomputes the rollups of closed days from the raw transaction and withdrawal history.
+
+    Closed days get no live writes, so their documents are replaced outright. The
+    all-time document is not replaced: it is corrected with $inc by how much the
+    rebuilt days changed, so increments landing during the rebuild are kept. With
+    include_open_days, today and yesterday are rebuilt too; that is only safe while
+    money-moving writes are paused. Returns the number of days rebuilt."""
+    def day_of(field):
+        return {'$dateToString': {'format': '%Y-%m-%d', 'date': field}}
+
+    cutoff = (datetime.now() - timedelta(days=ROLLUP_OPEN_DAYS - 1)).strftime('%Y-%m-%d')
+    closed = {'$match': {} if include_open_days else {'_id.day': {'$lt': cutoff}}}
+    rebuilt = {doc['_id']: doc for doc in transactions_collection.aggregate([
+        # One {_id: {day, key}, total, count} row per day and transaction type or final withdrawal status
+        {'$group': {'_id': {'day': day_of('$timestamp'), 'key': '$type'}, 'total': {'$sum': '$amount'}, 'count': {'$sum': 1}}},
+        {'$unionWith': {'coll': withdrawals_collection.name, 'pipeline': [
+            {'$match': {'status': {'$in': ['approved', 'rejected']}}},
+            {'$group': {
+                '_id': {'day': day_of({'$ifNull': ['$processed_at', '$requested_at']}), 'key': {'$concat': ['withdrawals_', '$status']}},
+                'total': {'$sum': '$amount'}, 'count': {'$sum': 1}
+            }}
+        ]}},
+        closed,
+        {'$group': {'_id': '$_id.day',
+                    'totals': {'$push': {'k': '$_id.key', 'v': '$total'}}, 'counts': {'$push': {'k': '$_id.key', 'v': '$count'}}}},
+        {'$project': {'_id': {'$concat': ['day:', '$_id']}, 'date': '$_id',
+                      'totals': {'$arrayToObject': '$totals'}, 'counts': {'$arrayToObject': '$counts'}}},
+    ])}
+    current_query = {'_id': {'$regex': '^day:'}}
+    if not include_open_days:
+        current_query['date'] = {'$lt': cutoff}
+    current = {doc['_id']: doc for doc in rollups_collection.find(current_query)}
+
+    all_time = {}
+    for day_id in rebuilt.keys() | current.keys():
+        for section in ('totals', 'counts'):
+            new_values = rebuilt.get(day_id, {}).get(section, {})
+            old_values = current.get(day_id, {}).get(section, {})
+            for key in new_values.keys() | old_values.keys():
+                change = new_values.get(key, 0) - old_values.get(key, 0)
+                if change:
+                    all_time[f"{section}.{key}"] = all_time.get(f"{section}.{key}", 0) + change
+
+    operations = [ReplaceOne({'_id': day_id}, doc, upsert=True) for day_id, doc in rebuilt.items()]
+    operations += [DeleteOne({'_id': day_id}) for day_id in current.keys() - rebuilt.keys()]
+    if all_time:
+        operations.append(UpdateOne({'_id': 'all'}, {'$inc': all_time}, upsert=True))
+    if operations:
+        rollups_collection.bulk_write(operations, ordered=False)
+    return len(rebuilt)
+
+def settle_color_round(round_id, chosen_color):
+    """Credits every winning bet of a color round with one bulk wallet write and one ledger insert.
+    Returns a dict of user_id -> total winnings credited."""
+    payout_multiplier = COLOR_PAYOUTS[chosen_color]
+    payouts = {}
+    transactions = []
+    for bet in bets_collection.find({'round_id': round_id, 'color': chosen_color}, {'user_id': 1, 'amount': 1}):
+        winnings = bet['amount'] * payout_multiplier
+        payouts[bet['user_id']] = payouts.get(bet['user_id'], 0) + winnings
+        transactions.append(build_transaction(bet['user_id'], winnings, 'win', f"Color game win on {chosen_color}", round_id))
+
+    if not payouts:
+        return payouts
+
+    wallet.credit_many(payouts)
+    ledger_writer.write(transactions)
+    return payouts
 
 def validate_upi(upi_id):
     """Basic UPI ID validation to check for 'name@handler' format."""
@@ -172,21 +450,52 @@ def validate_upi(upi_id):
         return False
     return True
 
+# --- Color Round Bet Pool ---
+# Running per-color totals and bettor counts for the current round, updated by place_bet.
+# With MULTI_WORKER the pool lives in one bet_pools document per round instead, since
+# bets can land on any worker.
+color_pool_lock = Lock()
+color_pool = {"round_id": None, "totals": {}, "bettors": {}}
+
+def record_color_bet(round_id, user_id, color, amount):
+    if app.config['MULTI_WORKER']:
+        bet_pools_collection.update_one(
+            {'_id': round_id},
+            {'$inc': {f'totals.{color}': amount}, '$addToSet': {f'bettors.{color}': user_id}, '$setOnInsert': {'created_at': datetime.now()}},
+            upsert=True
+        )
+        return
+    with color_pool_lock:
+        if color_pool["round_id"] != round_id:
+            color_pool.update({"round_id": round_id, "totals": {}, "bettors": {}})
+        color_pool["totals"][color] = color_pool["totals"].get(color, 0) + amount
+        color_pool["bettors"].setdefault(color, set()).add(user_id)
+
+def get_color_pool(round_id):
+    """Returns {color: {'amount': total staked, 'bettors': distinct users}} for a round."""
+    if app.config['MULTI_WORKER']:
+        projection = {f'totals.{c}': 1 for c in COLOR_PAYOUTS}
+        projection.update({f'counts.{c}': {'$size': {'$ifNull': [f'$bettors.{c}', []]}} for c in COLOR_PAYOUTS})
+        doc = bet_pools_collection.find_one({'_id': round_id}, projection) or {}
+        totals, counts = doc.get('totals', {}), doc.get('counts', {})
+    else:
+        with color_pool_lock:
+            same_round = color_pool["round_id"] == round_id
+            totals = dict(color_pool["totals"]) if same_round else {}
+            counts = {c: len(users) for c, users in color_pool["bettors"].items()} if same_round else {}
+    return {c: {'amount': totals.get(c, 0), 'bettors': counts.get(c, 0)} for c in COLOR_PAYOUTS}
+
+
 # --- Game Algorithms ---
 def get_next_color_result():
-    preset = preset_results_collection.find_one_and_delete({"game_type": "color", "used": False}, sort=[("created_at", 1)])
-    if preset and preset.get('outcome'):
-        return preset['outcome']
-
-    pipeline = [
-        {'$match': {'round_id': game_state['round_id']}},
-        {'$group': {'_id': '$color', 'total_amount': {'$sum': '$amount'}}}
-    ]
-    bet_distribution = {item['_id']: item['total_amount'] for item in bets_collection.aggregate(pipeline)}
+    preset = preset_queue.pop('color')
+    if preset:
+        return preset
 
-    total_red = bet_distribution.get('red', 0)
-    total_green = bet_distribution.get('green', 0)
-    total_violet = bet_distribution.get('violet', 0)
+    pool = get_color_pool(game_state['round_id'])
+    total_red = pool['red']['amount']
+    total_green = pool['green']['amount']
+    total_violet = pool['violet']['amount']
 
     weight_red = (1 / (total_red + 10))
     weight_green = (1 / (total_green + 10))
@@ -201,10 +510,14 @@ def get_next_color_result():
     chosen_color = random.choices(colors, weights=[prob_red, prob_green, max(5, prob_violet)], k=1)[0]
     return chosen_color
 
+def aviator_multiplier_at(elapsed):
+    """The flight curve shared with aviator_logic.js: 1 + 0.05t + 0.05t^1.5."""
+    return round(1.0 + 0.05 * elapsed + 0.05 * (elapsed ** 1.5), 2)
+
 def get_next_aviator_crash_point():
-    preset = preset_results_collection.find_one_and_delete({"game_type": "aviator", "used": False}, sort=[("created_at", 1)])
-    if preset and preset.get('outcome'):
-        return float(preset['outcome'])
+    preset = preset_queue.pop('aviator')
+    if preset:
+        return float(preset)
 
     rand = random.random()
     if rand < 0.40: return 1.00
@@ -215,96 +528,259 @@ def get_next_aviator_crash_point():
 
 
 # --- Background Game Loops ---
-thread = None
-aviator_thread = None
-
-@app.before_request
-def start_background_threads():
-    global thread, aviator_thread
-    if thread is None:
-        thread = Thread(target=game_loop)
-        thread.daemon = True
-        thread.start()
-    if aviator_thread is None:
-        aviator_thread = Thread(target=aviator_game_loop)
-        aviator_thread.daemon = True
-        aviator_thread.start()
+round_engine = None
+preset_queue = PresetQueue(preset_results_collection, start_task=socketio.start_background_task, sleep=socketio.sleep)
+
+def start_background_tasks():
+    """Starts the webhook workers, cache syncs and the round engine. Nothing here blocks
+    on Mongo, so a worker can serve requests while these connect."""
+    global round_engine
+    if round_engine is None:
+        for _ in range(WEBHOOK_WORKERS):
+            socketio.start_background_task(webhook_worker)
+        preset_queue.start()
+        user_cache.start()
+        socketio.start_background_task(warm_recent_results)
+        round_engine = RoundEngine(
+            RoundLease(leases_collection, ttl=int(os.getenv('ROUND_LEASE_TTL', 10))),
+            round_channel,
+            [game_loop, aviator_game_loop],
+            start_task=socketio.start_background_task,
+            sleep=socketio.sleep
+        )
+        round_engine.start()
+        atexit.register(round_engine.stop)
+
+def warm_recent_results():
+    for game, results in recent_results.items():
+        try:
+            results.warm()
+        except PyMongoError as e:
+            print(f"🔥 Could not load recent {game} results: {e}")
+
+def wall_clock(deadline):
+    """Converts a time.monotonic() deadline to epoch seconds for clients and other workers."""
+    return time.time() + (deadline - time.monotonic())
+
+def set_color_phase(phase, **fields):
+    with game_state_lock:
+        game_state["phase"] = phase
+        game_state.update(fields)
+        round_channel.publish('color', game_state)
+        state = dict(game_state)
+    # One broadcast per phase; clients count down to the deadlines themselves.
+    emit('color_round_update', {**state, "server_time": time.time()}, room='color')
 
 def game_loop():
-    while True:
-        with game_state_lock:
-            game_state["round_id"] = datetime.now().strftime('%Y%m%d%H%M%S')
-            game_state["timer"] = 30
-
-        while game_state["timer"] > 0:
-            socketio.emit('timer_update', {'timer': game_state['timer'], 'round_id': game_state['round_id']})
-            with game_state_lock:
-                game_state["timer"] -= 1
-            time.sleep(1)
+    """Runs color rounds on fixed monotonic deadlines: open, lock (COLOR_LOCK_TIME before
+    the end), settle, and the next round COLOR_BREAK_TIME later. Slow emits or settlement
+    never stretch a round; settlement runs in the background while the break elapses.
+    If leadership is lost before settlement, the round's bets are refunded and the loop
+    returns, leaving the new leader's rounds as the only ones running."""
+    next_round_at = time.monotonic()
+    while round_engine.is_leader():
+        opens_at = next_round_at
+        locks_at = opens_at + COLOR_ROUND_TIME - COLOR_LOCK_TIME
+        settles_at = opens_at + COLOR_ROUND_TIME
+        next_round_at = settles_at + COLOR_BREAK_TIME
+        round_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        set_color_phase("open", round_id=round_id, locks_at=wall_clock(locks_at), ends_at=wall_clock(settles_at), next_round_at=None)
+
+        # Pool totals are the only periodic color emit, scheduled on the same deadlines.
+        next_pool_at = opens_at
+        while time.monotonic() < locks_at:
+            emit('color_pool_update', {'round_id': round_id, 'pools': get_color_pool(round_id)}, room='color')
+            next_pool_at += COLOR_POOL_INTERVAL
+            if not round_engine.wait_until(min(next_pool_at, locks_at)):
+                return refund_color_round(round_id)
+        set_color_phase("locked")
+        emit('color_pool_update', {'round_id': round_id, 'pools': get_color_pool(round_id)}, room='color')
+        if not round_engine.wait_until(settles_at):
+            return refund_color_round(round_id)
 
         chosen_color = get_next_color_result()
-        games_collection.insert_one({'round_id': game_state['round_id'], 'result_color': chosen_color, 'timestamp': datetime.now()})
-
-        winning_bets = list(bets_collection.find({'round_id': game_state['round_id'], 'color': chosen_color}))
-        for bet in winning_bets:
-            payout_multiplier = 9 if chosen_color == "violet" else 2
-            winnings = bet['amount'] * payout_multiplier
-            users_collection.update_one({'_id': bet['user_id']}, {'$inc': {'wallet.balance': winnings}})
-            log_transaction(bet['user_id'], winnings, 'win', f"Color game win on {chosen_color}", game_state['round_id'])
-
-            user_session_id = get_user_sid(str(bet['user_id']))
-            if user_session_id:
-                user = users_collection.find_one({'_id': bet['user_id']})
-                socketio.emit('personal_update', {'message': f"You won ₹{winnings:.2f}!", 'balance': user['wallet']['balance']}, room=user_session_id)
-
-        socketio.emit('new_result', {'round_id': game_state['round_id'], 'result_color': chosen_color})
-        time.sleep(5)
+        set_color_phase("settling", next_round_at=wall_clock(next_round_at))
+        socketio.start_background_task(finish_color_round, round_id, chosen_color)
+        round_engine.wait_until(next_round_at)
 
 def aviator_game_loop():
-    while True:
+    while round_engine.is_leader():
         with aviator_state_lock:
             aviator_game_state["status"] = "waiting"
             aviator_game_state["round_id"] = datetime.now().strftime('AV%Y%m%d%H%M%S')
             aviator_game_state["crash_point"] = get_next_aviator_crash_point()
+            round_channel.publish('aviator', aviator_game_state)
+
+        reset_aviator_roster(aviator_game_state["round_id"])
 
         for i in range(AVIATOR_WAIT_TIME, 0, -1):
             with aviator_state_lock:
                 aviator_game_state["timer"] = i
-            socketio.emit('aviator_state_update', {"status": "waiting", "timer": i, "round_id": aviator_game_state["round_id"]})
-            socketio.emit('aviator_bets_update', get_live_aviator_bets(aviator_game_state["round_id"]))
-            time.sleep(1)
+                round_channel.publish('aviator', aviator_game_state)
+            emit('aviator_state_update', {"status": "waiting", "timer": i, "round_id": aviator_game_state["round_id"]}, room='aviator')
+            if not round_engine.wait_until(time.monotonic() + 1):
+                return refund_aviator_round(aviator_game_state["round_id"])
 
         with aviator_state_lock:
             aviator_game_state["status"] = "flying"
             aviator_game_state["start_time"] = time.time()
-        socketio.emit('aviator_state_update', {"status": "flying"})
+            start_time = aviator_game_state["start_time"]
+            round_channel.publish('aviator', aviator_game_state)
+        if AVIATOR_CURVE_MODE == 'local':
+            emit('aviator_state_update', {"status": "flying", "start_time": start_time, "server_time": time.time()}, room='aviator')
+        else:
+            emit('aviator_state_update', {"status": "flying"}, room='aviator')
 
+        round_id = aviator_game_state["round_id"]
+        crash_point = aviator_game_state["crash_point"]
+        auto_cashouts = load_auto_cashouts(round_id)
+        last_checkpoint = start_time
+        next_tick = start_time
         while True:
+            if not round_engine.is_leader():
+                return refund_aviator_round(round_id)
             with aviator_state_lock:
                 if aviator_game_state["status"] != "flying": break
-                elapsed = time.time() - aviator_game_state["start_time"]
-                current_multiplier = round(1.0 + 0.05 * elapsed + 0.05 * (elapsed ** 1.5), 2)
+                now = time.time()
+                current_multiplier = aviator_multiplier_at(now - start_time)
                 aviator_game_state["current_multiplier"] = current_multiplier
-                if current_multiplier >= aviator_game_state["crash_point"]:
+                if current_multiplier >= crash_point:
                     break
 
-            socketio.emit('aviator_multiplier_update', {"multiplier": current_multiplier})
-            time.sleep(0.1)
+            due = pop_due_cashouts(auto_cashouts, current_multiplier, crash_point)
+            if due:
+                settle_auto_cashouts(round_id, due)
+
+            if AVIATOR_CURVE_MODE != 'local':
+                emit('aviator_multiplier_update', {"multiplier": current_multiplier}, room='aviator')
+            elif now - last_checkpoint >= AVIATOR_CHECKPOINT_INTERVAL:
+                emit('aviator_multiplier_update', {"multiplier": current_multiplier, "server_time": now}, room='aviator')
+                last_checkpoint = now
+            # Sleep to the next scheduled tick rather than a fixed interval, so time spent
+            # emitting does not accumulate as jitter.
+            next_tick += AVIATOR_TICK_INTERVAL
+            socketio.sleep(max(0, next_tick - time.time()))
+            aviator_tick_jitter.observe(max(0, time.time() - next_tick))
+
+        # Targets between the last tick and the crash point were still reached.
+        due = pop_due_cashouts(auto_cashouts, crash_point, crash_point)
+        if due:
+            settle_auto_cashouts(round_id, due)
 
         with aviator_state_lock:
             aviator_game_state["status"] = "crashed"
             final_multiplier = aviator_game_state["crash_point"]
-
-        aviator_games_collection.insert_one({"round_id": aviator_game_state["round_id"], "crash_multiplier": final_multiplier, "timestamp": datetime.now()})
-        aviator_bets_collection.update_many({"round_id": aviator_game_state["round_id"], "status": "bet_placed"}, {"$set": {"status": "lost"}})
-
-        socketio.emit('aviator_crash', {"multiplier": final_multiplier})
-        socketio.emit('aviator_bets_update', get_live_aviator_bets(aviator_game_state["round_id"]))
-        time.sleep(AVIATOR_BREAK_TIME)
+            round_channel.publish('aviator', aviator_game_state)
+
+        finish_aviator_round(aviator_game_state["round_id"], final_multiplier)
+        round_engine.wait_until(time.monotonic() + AVIATOR_BREAK_TIME)
+
+# --- Aviator Auto Cash-Out ---
+AVIATOR_MIN_AUTO_CASHOUT = 1.01
+AVIATOR_MAX_AUTO_CASHOUT = 1000.0
+
+def load_auto_cashouts(round_id):
+    """A round's auto cash-out targets as a min-heap of (target, bet_id). Bets can only be
+    placed or canceled while the round is waiting, so the set is final at takeoff. The range
+    filter also keeps a malformed target (NaN sorts below every number) out of the heap."""
+    target_range = {'$gte': AVIATOR_MIN_AUTO_CASHOUT, '$lte': AVIATOR_MAX_AUTO_CASHOUT}
+    heap = [(bet['auto_cashout'], bet['_id']) for bet in aviator_bets_collection.find(
+        {'round_id': round_id, 'status': 'bet_placed', 'auto_cashout': target_range}, {'auto_cashout': 1})]
+    heapq.heapify(heap)
+    return heap
+
+def pop_due_cashouts(heap, multiplier, crash_point):
+    """Pops the bets whose target has been reached and is below the crash point, in O(k log n)."""
+    due = []
+    while heap and heap[0][0] <= multiplier and heap[0][0] < crash_point:
+        due.append(heapq.heappop(heap)[1])
+    return due
+
+def settle_auto_cashouts(round_id, bet_ids):
+    """Cashes out one tick's batch of auto cash-out bets at their targets with a single bets
+    update, one bulk wallet write and one ledger insert. Bets the player already cashed out
+    by hand no longer match the 'bet_placed' filter and are skipped."""
+    batch_id = ObjectId()
+    aviator_bets_collection.update_many(
+        {'_id': {'$in': bet_ids}, 'status': 'bet_placed'},
+        [{'$set': {'status': 'cashed_out', 'cashout_multiplier': '$auto_cashout',
+                   'winnings': {'$multiply': ['$amount', '$auto_cashout']}, 'settle_batch': batch_id}}]
+    )
+    settled = list(aviator_bets_collection.find({'_id': {'$in': bet_ids}, 'settle_batch': batch_id},
+                                                {'user_id': 1, 'cashout_multiplier': 1, 'winnings': 1}))
+    if not settled:
+        return
+
+    credits = {}
+    for bet in settled:
+        credits[bet['user_id']] = credits.get(bet['user_id'], 0) + bet['winnings']
+    wallet.credit_many(credits)
+    ledger_writer.write([build_transaction(bet['user_id'], bet['winnings'], 'win', f"Aviator auto cashout @{bet['cashout_multiplier']:.2f}x", round_id)
+                         for bet in settled])
+
+    update_roster_bets({bet['_id']: {'status': 'cashed_out', 'cashout_multiplier': bet['cashout_multiplier'], 'winnings': bet['winnings']}
+                        for bet in settled})
+    for bet in settled:
+        emit('aviator_auto_cashout', {'multiplier': bet['cashout_multiplier'], 'winnings': bet['winnings']}, room=user_room(bet['user_id']))
+
+@settlement_duration.time(game='color')
+def finish_color_round(round_id, chosen_color):
+    """Records a color round's result, pays the winners and announces the result. Returns the payouts."""
+    result = {'round_id': round_id, 'result_color': chosen_color, 'timestamp': datetime.now()}
+    games_collection.insert_one(result)
+    record_result('color', result)
+
+    payouts = settle_color_round(round_id, chosen_color)
+    for user_id, winnings in payouts.items():
+        # The client applies the credit to its displayed balance, so no re-read is needed.
+        emit('personal_update', {'message': f"You won ₹{winnings:.2f}!", 'credit': winnings}, room=user_room(user_id))
+
+    emit('new_result', {'round_id': round_id, 'result_color': chosen_color}, room='color')
+    return payouts
+
+def refund_color_round(round_id):
+    """Refunds the bets of a color round abandoned when this worker lost the round lease.
+    The bets are claimed with a refund tag first, so each is refunded at most once."""
+    print(f"Round engine: abandoning color round {round_id}, refunding its bets.")
+    batch_id = ObjectId()
+    bets_collection.update_many({'round_id': round_id, 'refund_batch': {'$exists': False}}, {'$set': {'refund_batch': batch_id}})
+    refund_bets(bets_collection.find({'round_id': round_id, 'refund_batch': batch_id}, {'user_id': 1, 'amount': 1}),
+                "Color round canceled", round_id)
+
+def refund_aviator_round(round_id):
+    """Refunds the still-open bets of an aviator round abandoned when this worker lost the
+    round lease. Bets already cashed out keep their winnings."""
+    print(f"Round engine: abandoning aviator round {round_id}, refunding open bets.")
+    batch_id = ObjectId()
+    aviator_bets_collection.update_many({'round_id': round_id, 'status': 'bet_placed'},
+                                        {'$set': {'status': 'refunded', 'settle_batch': batch_id}})
+    refund_bets(aviator_bets_collection.find({'round_id': round_id, 'settle_batch': batch_id}, {'user_id': 1, 'amount': 1}),
+                "Aviator round canceled", round_id)
+
+def refund_bets(bets, description, round_id):
+    refunds = {}
+    transactions = []
+    for bet in bets:
+        refunds[bet['user_id']] = refunds.get(bet['user_id'], 0) + bet['amount']
+        transactions.append(build_transaction(bet['user_id'], bet['amount'], 'refund', description, round_id))
+    wallet.credit_many(refunds)
+    ledger_writer.write(transactions)
+    for user_id, amount in refunds.items():
+        emit('personal_update', {'message': f"{description}: ₹{amount:.2f} refunded.", 'credit': amount}, room=user_room(user_id))
+
+@settlement_duration.time(game='aviator')
+def finish_aviator_round(round_id, crash_multiplier):
+    """Records a crashed aviator round and marks its remaining bets as lost."""
+    result = {"round_id": round_id, "crash_multiplier": crash_multiplier, "timestamp": datetime.now()}
+    aviator_games_collection.insert_one(result)
+    record_result('aviator', result)
+    aviator_bets_collection.update_many({"round_id": round_id, "status": "bet_placed"}, {"$set": {"status": "lost"}})
+
+    emit('aviator_crash', {"multiplier": crash_multiplier}, room='aviator')
+    mark_roster_lost()
 
 
 # --- User Session & Auth ---
-user_sids = {}
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -322,29 +798,148 @@ def admin_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def user_room(user_id):
+    """Every socket of a logged-in user (all tabs, any worker) joins this room."""
+    return f"user:{user_id}"
+
 @socketio.on('connect')
 def handle_connect():
     if 'user_id' in session:
-        user_sids[session['user_id']] = request.sid
+        join_room(user_room(session['user_id']))
+
+@socketio.on('aviator_clock_sync')
+def handle_aviator_clock_sync(data):
+    # Returned as the ack so the client can estimate its offset from the round trip.
+    return {"client_time": (data or {}).get('client_time'), "server_time": time.time()}
+
+# --- Game Rooms ---
+# Round events go only to sockets on that game's page. Each page subscribes through
+# its *_join event; sockets elsewhere (hub, the other game) only get personal updates.
+GAME_ROOMS = ('color', 'aviator')
+room_members_lock = Lock()
+room_members = {room: set() for room in GAME_ROOMS}
+
+def subscribe(room):
+    join_room(room)
+    with room_members_lock:
+        room_members[room].add(request.sid)
+
+def room_subscriber_counts():
+    """Sockets subscribed to each game room on this worker."""
+    with room_members_lock:
+        return {room: len(members) for room, members in room_members.items()}
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    if 'user_id' in session and session['user_id'] in user_sids:
-        if user_sids.get(session['user_id']) == request.sid:
-            del user_sids[session['user_id']]
+    with room_members_lock:
+        for members in room_members.values():
+            members.discard(request.sid)
+
+@socketio.on('color_join')
+def handle_color_join():
+    subscribe('color')
+    # Returned as the ack: the current phase and deadlines, plus server time for the client's clock offset.
+    return {**get_color_state(), "server_time": time.time()}
+
+@socketio.on('aviator_join')
+def handle_aviator_join():
+    subscribe('aviator')
+    emit('aviator_bets_update', get_aviator_roster_snapshot(), room=request.sid)
+    # A socket joining mid-flight missed the one-off 'flying' update, which carries the
+    # start time the local curve is drawn from; without it the page only moves on checkpoints.
+    state = get_aviator_state()
+    if state['status'] == 'flying' and AVIATOR_CURVE_MODE == 'local':
+        emit('aviator_state_update', {"status": "flying", "start_time": state['start_time'], "server_time": time.time()}, room=request.sid)
+
+
+# --- Aviator Live Bet Roster ---
+# The current round's bets live in memory; clients receive one snapshot on join
+# and small 'aviator_bet_delta' events (add/update/remove/crash) afterwards.
+aviator_roster_lock = Lock()
+aviator_roster = {"round_id": None, "bets": {}}
+
+def get_masked_name(user):
+    """Returns the public '***1234' label for a user document that includes 'mobile'."""
+    mobile = user.get('mobile')
+    return f"***{mobile[-4:]}" if mobile else '***????'
+
+def get_aviator_roster_snapshot():
+    if app.config['MULTI_WORKER']:
+        # Bets may have been placed on other workers, so build the snapshot from Mongo.
+        return load_aviator_roster(get_aviator_state()['round_id'])
+    with aviator_roster_lock:
+        return {"round_id": aviator_roster["round_id"], "bets": [dict(bet) for bet in aviator_roster["bets"].values()]}
+
+def load_aviator_roster(round_id):
+    """Reads a round's roster with a single aggregation (one $lookup for the masked names)."""
+    pipeline = [
+        {'$match': {'round_id': round_id}},
+        {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user', 'pipeline': [{'$project': {'mobile': 1}}]}},
+        {'$project': {'amount': 1, 'status': 1, 'cashout_multiplier': 1, 'winnings': 1, 'user': {'$first': '$user'}}}
+    ]
+    bets = []
+    for bet in aviator_bets_collection.aggregate(pipeline):
+        user = bet.pop('user', None) or {'_id': None}
+        bet['id'] = str(bet.pop('_id'))
+        bet['user'] = get_masked_name(user) if user['_id'] else '***????'
+        bets.append(bet)
+    return {"round_id": round_id, "bets": bets}
+
+def reset_aviator_roster(round_id):
+    with aviator_roster_lock:
+        aviator_roster["round_id"] = round_id
+        aviator_roster["bets"] = {}
+    emit('aviator_bet_delta', {"op": "reset", "round_id": round_id}, room='aviator')
+
+def add_roster_bet(bet_id, user, amount, round_id):
+    entry = {"id": str(bet_id), "user": get_masked_name(user), "amount": amount, "status": "bet_placed"}
+    with aviator_roster_lock:
+        if aviator_roster["round_id"] != round_id:
+            # Followers never run reset_aviator_roster, so roll the roster over here.
+            aviator_roster["round_id"] = round_id
+            aviator_roster["bets"] = {}
+        aviator_roster["bets"][entry["id"]] = entry
+    emit('aviator_bet_delta', {"op": "add", "bet": entry}, room='aviator')
+
+def update_roster_bet(bet_id, **fields):
+    """Applies fields to a roster entry and sends the update. A bet placed on another
+    worker is not in this roster, so it is sent with just the changed fields."""
+    with aviator_roster_lock:
+        entry = aviator_roster["bets"].get(str(bet_id))
+        if entry is not None:
+            entry.update(fields)
+            entry = dict(entry)
+        else:
+            entry = {"id": str(bet_id), **fields}
+    emit('aviator_bet_delta', {"op": "update", "bet": entry}, room='aviator')
+
+def update_roster_bets(updates):
+    """Applies {bet_id: fields} to several roster entries and sends them as one delta.
+    Bets placed on another worker are sent with just the changed fields."""
+    entries = []
+    with aviator_roster_lock:
+        for bet_id, fields in updates.items():
+            entry = aviator_roster["bets"].get(str(bet_id))
+            if entry is not None:
+                entry.update(fields)
+                entries.append(dict(entry))
+            else:
+                entries.append({"id": str(bet_id), **fields})
+    emit('aviator_bet_delta', {"op": "batch_update", "bets": entries}, room='aviator')
 
-def get_user_sid(user_id):
-    return user_sids.get(user_id)
+def remove_roster_bet(bet_id):
+    # Always sent: the bet may have been placed on another worker.
+    with aviator_roster_lock:
+        aviator_roster["bets"].pop(str(bet_id), None)
+    emit('aviator_bet_delta', {"op": "remove", "bet": {"id": str(bet_id)}}, room='aviator')
 
-def get_live_aviator_bets(round_id):
-    bets_cursor = aviator_bets_collection.find({'round_id': round_id}, {'_id': 0, 'user_id': 1, 'amount': 1, 'status': 1, 'cashout_multiplier': 1, 'winnings': 1})
-    live_bets = []
-    for bet in bets_cursor:
-        user = users_collection.find_one({'_id': bet['user_id']}, {'mobile': 1})
-        bet['user'] = f"***{user['mobile'][-4:]}" if user else '***????'
-        del bet['user_id']
-        live_bets.append(bet)
-    return live_bets
+def mark_roster_lost():
+    """Marks every bet still in play as lost; clients apply the same rule on the 'crash' delta."""
+    with aviator_roster_lock:
+        for entry in aviator_roster["bets"].values():
+            if entry["status"] == "bet_placed":
+                entry["status"] = "lost"
+    emit('aviator_bet_delta', {"op": "crash"}, room='aviator')
 
 
 # --- Main Routes ---
@@ -361,20 +956,29 @@ def hub():
 @app.route('/game')
 @login_required
 def game():
-    user = users_collection.find_one({'_id': ObjectId(session['user_id'])})
-    recent_games = list(games_collection.find().sort('timestamp', DESCENDING).limit(10))
+    user = user_cache.get(ObjectId(session['user_id']))
+    recent_games = get_recent_results('color')
     return render_template('game.html', user=user, recent_games=recent_games)
 
 @app.route('/aviator')
 @login_required
 def aviator():
     user_id = ObjectId(session['user_id'])
-    user = users_collection.find_one({'_id': user_id})
-    current_bet = aviator_bets_collection.find_one({'user_id': user_id, 'round_id': aviator_game_state.get("round_id")})
+    user = user_cache.get(user_id)
+    current_bet = aviator_bets_collection.find_one({'user_id': user_id, 'round_id': get_aviator_state()['round_id']})
     if current_bet: current_bet['_id'] = str(current_bet['_id'])
-    recent_games = list(aviator_games_collection.find().sort('timestamp', DESCENDING).limit(10))
+    recent_games = get_recent_results('aviator')
     return render_template('aviator.html', user=user, recent_games=recent_games, current_bet=current_bet)
 
+@app.route('/api/history/<game>')
+@login_required
+def recent_history(game):
+    """Recent round results from the in-process buffer."""
+    if game not in recent_results:
+        return jsonify({'status': 'error', 'message': 'Unknown game.'}), 404
+    results = [{**r, 'timestamp': r['timestamp'].isoformat()} for r in get_recent_results(game)]
+    return jsonify({'status': 'success', 'game': game, 'results': results})
+
 
 # --- Auth Routes ---
 @app.route('/register', methods=['POST'])
@@ -441,54 +1045,74 @@ def place_bet():
     except (ValueError, TypeError):
         return jsonify({"status": "error", "message": "Invalid bet data."}), 400
 
-    if game_state['timer'] <= 5:
+    color_state = get_color_state()
+    if color_state['phase'] != 'open' or time.time() >= color_state['locks_at']:
         return jsonify({"status": "error", "message": "Betting is closed for this round."})
 
-    user = users_collection.find_one({'_id': user_id})
-    if user['wallet']['balance'] < amount:
+    user = wallet.debit(user_id, amount)
+    if user is None:
         return jsonify({"status": "error", "message": "Insufficient funds."})
 
-    users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': -amount}})
-    log_transaction(user_id, -amount, 'bet', f"Color game bet on {color}", game_state['round_id'])
-    bets_collection.insert_one({'user_id': user_id, 'round_id': game_state['round_id'], 'color': color, 'amount': amount, 'timestamp': datetime.now()})
+    log_transaction(user_id, -amount, 'bet', f"Color game bet on {color}", color_state['round_id'])
+    bets_collection.insert_one({'user_id': user_id, 'round_id': color_state['round_id'], 'color': color, 'amount': amount, 'timestamp': datetime.now()})
+    record_color_bet(color_state['round_id'], user_id, color, amount)
 
-    new_balance = user['wallet']['balance'] - amount
+    new_balance = user['wallet']['balance']
     return jsonify({"status": "success", "message": f"Bet of ₹{amount:.2f} on {color} placed!", "new_balance": new_balance})
 
 @app.route('/api/aviator/bet', methods=['POST'])
 @login_required
 def place_aviator_bet():
-    if aviator_game_state['status'] != 'waiting':
+    aviator_state = get_aviator_state()
+    if aviator_state['status'] != 'waiting':
         return jsonify({"status": "error", "message": "Betting is currently closed."}), 400
     data = request.get_json()
     user_id = ObjectId(session['user_id'])
     try:
         amount = float(data.get('amount'))
         if amount <= 0: raise ValueError("Invalid amount")
+        # Optional target multiplier; the round loop cashes the bet out when it is reached.
+        auto_cashout = data.get('auto_cashout')
+        if auto_cashout not in (None, ''):
+            auto_cashout = round(float(auto_cashout), 2)
+            # Written so NaN fails too: every comparison with NaN is False.
+            if not AVIATOR_MIN_AUTO_CASHOUT <= auto_cashout <= AVIATOR_MAX_AUTO_CASHOUT: raise ValueError("Invalid auto cashout")
+        else:
+            auto_cashout = None
     except (ValueError, TypeError):
         return jsonify({"status": "error", "message": "Invalid bet data."}), 400
 
-    user = users_collection.find_one({'_id': user_id})
-    if user['wallet']['balance'] < amount:
+    bet = {'user_id': user_id, 'round_id': aviator_state['round_id'], 'amount': amount, 'status': 'bet_placed', 'timestamp': datetime.now()}
+    if auto_cashout:
+        bet['auto_cashout'] = auto_cashout
+    # Debit before inserting, so a bet row only ever exists once it is funded; cancel
+    # and cashout can then never pay out against an unfunded bet.
+    user = wallet.debit(user_id, amount, fields=('mobile',))
+    if user is None:
         return jsonify({"status": "error", "message": "Insufficient funds."}), 400
-    if aviator_bets_collection.find_one({"user_id": user_id, "round_id": aviator_game_state['round_id']}):
+    # The unique (user_id, round_id) index rejects a second bet for the round.
+    try:
+        bet_id = aviator_bets_collection.insert_one(bet).inserted_id
+    except DuplicateKeyError:
+        wallet.credit(user_id, amount)
         return jsonify({"status": "error", "message": "You have already placed a bet for this round."}), 400
 
-    users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': -amount}})
-    log_transaction(user_id, -amount, 'bet', "Aviator bet", aviator_game_state['round_id'])
-    aviator_bets_collection.insert_one({'user_id': user_id, 'round_id': aviator_game_state['round_id'], 'amount': amount, 'status': 'bet_placed', 'timestamp': datetime.now()})
+    log_transaction(user_id, -amount, 'bet', "Aviator bet", aviator_state['round_id'])
 
-    socketio.emit('aviator_bets_update', get_live_aviator_bets(aviator_game_state["round_id"]))
-    new_balance = user['wallet']['balance'] - amount
-    return jsonify({"status": "success", "message": f"Bet of ₹{amount:.2f} placed!", "new_balance": new_balance})
+    add_roster_bet(bet_id, user, amount, aviator_state['round_id'])
+    new_balance = user['wallet']['balance']
+    message = f"Bet of ₹{amount:.2f} placed!"
+    if auto_cashout:
+        message += f" Auto cash out at {auto_cashout:.2f}x."
+    return jsonify({"status": "success", "message": message, "new_balance": new_balance})
 
 @app.route('/api/aviator/cancel', methods=['POST'])
 @login_required
 def cancel_aviator_bet():
-    with aviator_state_lock:
-        if aviator_game_state['status'] != 'waiting':
-            return jsonify({"status": "error", "message": "Cannot cancel bet now. The game has already started."}), 400
-        round_id = aviator_game_state['round_id']
+    aviator_state = get_aviator_state()
+    if aviator_state['status'] != 'waiting':
+        return jsonify({"status": "error", "message": "Cannot cancel bet now. The game has already started."}), 400
+    round_id = aviator_state['round_id']
 
     user_id = ObjectId(session['user_id'])
 
@@ -500,12 +1124,11 @@ def cancel_aviator_bet():
         return jsonify({"status": "error", "message": "No active bet found to cancel."}), 400
 
     refund_amount = bet_to_cancel['amount']
-    users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': refund_amount}})
+    user = wallet.credit(user_id, refund_amount)
     log_transaction(user_id, refund_amount, 'refund', 'Aviator bet canceled', bet_to_cancel['_id'])
 
-    socketio.emit('aviator_bets_update', get_live_aviator_bets(round_id))
+    remove_roster_bet(bet_to_cancel['_id'])
 
-    user = users_collection.find_one({'_id': user_id})
     return jsonify({
         "status": "success",
         "message": "Your bet has been canceled and the amount refunded.",
@@ -515,28 +1138,145 @@ def cancel_aviator_bet():
 @app.route('/api/aviator/cashout', methods=['POST'])
 @login_required
 def cashout_aviator():
-    with aviator_state_lock:
-        if aviator_game_state['status'] != 'flying':
-            return jsonify({"status": "error", "message": "Cannot cash out now."}), 400
-        cashout_multiplier = aviator_game_state['current_multiplier']
-        round_id = aviator_game_state['round_id']
+    aviator_state = get_aviator_state()
+    if aviator_state['status'] != 'flying':
+        return jsonify({"status": "error", "message": "Cannot cash out now."}), 400
+    # Authoritative multiplier from the flight start, not the last loop tick.
+    cashout_multiplier = aviator_multiplier_at(time.time() - aviator_state['start_time'])
+    if cashout_multiplier >= aviator_state['crash_point']:
+        return jsonify({"status": "error", "message": "Cannot cash out now."}), 400
+    round_id = aviator_state['round_id']
 
     user_id = ObjectId(session['user_id'])
 
-    bet_to_cashout = aviator_bets_collection.find_one({'user_id': user_id, 'round_id': round_id, 'status': 'bet_placed'})
+    # Claim and settle the bet in one conditional update, so a double click cannot cash out twice.
+    bet_to_cashout = aviator_bets_collection.find_one_and_update(
+        {'user_id': user_id, 'round_id': round_id, 'status': 'bet_placed'},
+        [{'$set': {'status': 'cashed_out', 'cashout_multiplier': cashout_multiplier, 'winnings': {'$multiply': ['$amount', cashout_multiplier]}}}],
+        projection={'winnings': 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not bet_to_cashout:
         return jsonify({"status": "error", "message": "No active bet found to cash out."}), 400
 
-    winnings = bet_to_cashout['amount'] * cashout_multiplier
-    aviator_bets_collection.update_one({'_id': bet_to_cashout['_id']}, {'$set': {'status': 'cashed_out', 'cashout_multiplier': cashout_multiplier, 'winnings': winnings}})
-    users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': winnings}})
+    winnings = bet_to_cashout['winnings']
+    user = wallet.credit(user_id, winnings)
     log_transaction(user_id, winnings, 'win', f"Aviator cashout @{cashout_multiplier:.2f}x", round_id)
 
-    socketio.emit('aviator_bets_update', get_live_aviator_bets(round_id))
-    user = users_collection.find_one({'_id': user_id})
+    update_roster_bet(bet_to_cashout['_id'], status='cashed_out', cashout_multiplier=cashout_multiplier, winnings=winnings)
     return jsonify({"status": "success", "message": f"Cashed out for ₹{winnings:.2f}!", "new_balance": user['wallet']['balance']})
 
 
+# --- Webhook Inbox ---
+# cashfree_webhook only verifies and stores events; these workers drain the inbox.
+# Claims are atomic, so workers in every process can share one inbox.
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 2))
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_LOCK_SECONDS = 60
+WEBHOOK_POLL_INTERVAL = 2
+WEBHOOK_RETRY_DELAY = 5  # seconds before the first retry, doubled on each further attempt
+webhook_wakeup = Event()
+
+def webhook_event_key(data, payload):
+    """Gateway retries of the same order status share a key; other events are keyed by content."""
+    order = data.get('data', {}).get('order', {})
+    if order.get('order_id'):
+        return f"{data.get('type')}:{order['order_id']}:{order.get('order_status')}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def credit_gateway_deposit(user_id, amount, order_id):
+    """Credits a gateway deposit exactly once. The ledger entry and the wallet credit commit
+    together, and the unique associated_id index rejects a repeat. Returns the new balance,
+    or None if the order was already credited."""
+    transaction = build_transaction(user_id, amount, 'deposit', 'Deposit via Cashfree', order_id)
+
+    def apply(db_session):
+        transactions_collection.insert_one(transaction, session=db_session)
+        return wallet.credit(user_id, amount, session=db_session)
+
+    try:
+        with client.start_session() as db_session:
+            user = db_session.with_transaction(apply)
+    except DuplicateKeyError:
+        return None
+    user_cache.patch(user_id, {'wallet.balance': user['wallet']['balance']})
+    rollup_transactions([transaction])
+    return user['wallet']['balance']
+
+def process_webhook_event(data):
+    order = data.get('data', {}).get('order', {})
+    if not order:
+        print(f"Webhook received non-order event: {data.get('type')}")
+        return
+
+    order_status = order.get('order_status')
+    order_id = order.get('order_id')
+    user_id_str = order.get('customer_details', {}).get('customer_id')
+
+    print(f"Processing webhook for Order ID: {order_id}, Status: {order_status}, User: {user_id_str}")
+
+    if order_status == 'PAID':
+        amount = float(order['order_amount'])
+        user_id = ObjectId(user_id_str)
+        new_balance = credit_gateway_deposit(user_id, amount, order_id)
+        if new_balance is None:
+            print(f"Order {order_id} already processed. Skipping.")
+            return
+        print(f"Credited ₹{amount} to user {user_id_str} for order {order_id}")
+
+        # Notify every open tab of the user, whichever worker it is connected to
+        emit('personal_update', {'message': f"₹{amount:.2f} added to your wallet.", 'balance': new_balance}, room=user_room(user_id))
+
+    elif order_status in ['FAILED', 'REFUNDED']:
+        amount = float(order['order_amount'])
+        user_id = ObjectId(user_id_str)
+        log_transaction(user_id, amount, 'deposit_failed', f"Payment failed/refunded for order {order_id}", order_id)
+
+        # Notify every open tab of the user, whichever worker it is connected to
+        emit('personal_update', {'message': f"Your payment of ₹{amount:.2f} did not complete. Please try again."}, room=user_room(user_id))
+    else:
+        print(f"Received unhandled order status: {order_status}")
+
+def claim_webhook_event():
+    """Atomically takes the oldest pending event, or one whose worker died mid-processing."""
+    now = datetime.now()
+    return webhook_inbox_collection.find_one_and_update(
+        {'$or': [{'status': 'pending'}, {'status': 'processing', 'locked_until': {'$lt': now}}]},
+        {'$set': {'status': 'processing', 'locked_until': now + timedelta(seconds=WEBHOOK_LOCK_SECONDS)}, '$inc': {'attempts': 1}},
+        sort=[('received_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def webhook_worker():
+    while True:
+        try:
+            event = claim_webhook_event()
+        except Exception as e:
+            print(f"🔥 Webhook inbox claim failed: {e}")
+            event = None
+        if event is None:
+            webhook_wakeup.wait(WEBHOOK_POLL_INTERVAL)
+            webhook_wakeup.clear()
+            continue
+
+        try:
+            process_webhook_event(json.loads(event['payload']))
+            update = {'status': 'done', 'processed_at': datetime.now()}
+        except Exception as e:
+            print(f"🔥 Webhook processing error: {str(e)}")
+            if event['attempts'] >= WEBHOOK_MAX_ATTEMPTS:
+                update = {'status': 'failed', 'last_error': str(e)}
+            else:
+                # Stays claimed until the backoff ends; claim_webhook_event then retakes it as an expired lock.
+                retry_in = WEBHOOK_RETRY_DELAY * 2 ** (event['attempts'] - 1)
+                update = {'locked_until': datetime.now() + timedelta(seconds=retry_in), 'last_error': str(e)}
+        try:
+            webhook_inbox_collection.update_one({'_id': event['_id']}, {'$set': update})
+        except Exception as e:
+            # The claim's lock expires on its own, so the event is retried rather than lost.
+            print(f"🔥 Webhook status update failed: {e}")
+
+
 # --- Payment Routes (Cashfree Integration) ---
 @app.route('/api/payment/create_order', methods=['POST'])
 @login_required
@@ -549,7 +1289,7 @@ def create_payment_order():
         return jsonify({"status": "error", "message": "Invalid amount."}), 400
 
     user_id = session['user_id']
-    user = users_collection.find_one({'_id': ObjectId(user_id)})
+    user = user_cache.get(ObjectId(user_id))
     
     user_email = user.get('email')
     if not user_email:
@@ -561,12 +1301,6 @@ def create_payment_order():
 
     order_id = f"order_{int(time.time())}_{user_id}"
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-version": app.config['CASHFREE_API_VERSION'],
-        "x-client-id": app.config['CASHFREE_CLIENT_ID'],
-        "x-client-secret": app.config['CASHFREE_CLIENT_SECRET']
-    }
     payload = {
         "order_id": order_id,
         "order_amount": amount,
@@ -584,13 +1318,11 @@ def create_payment_order():
     print(f"Sending payload to Cashfree: {payload}")
 
     try:
-        response = requests.post(f"{CASHFREE_API_URL}/orders", json=payload, headers=headers)
-        response.raise_for_status()
-        order_data = response.json()
+        order_data = cashfree_client.create_order(payload)
         return jsonify({"status": "success", "payment_session_id": order_data.get('payment_session_id')})
     except requests.exceptions.RequestException as e:
         print(f"Cashfree API Error: {e}")
-        if e.response:
+        if e.response is not None:
             print(f"Response Body: {e.response.text}")
         return jsonify({"status": "error", "message": "Could not connect to payment gateway."}), 500
 
@@ -627,58 +1359,25 @@ def cashfree_webhook():
     
     print("✅ Webhook signature verified successfully.")
 
-    # 5. Process the webhook (only runs if signature is valid)
+    # 5. Persist the raw event and acknowledge; webhook workers process it asynchronously
     try:
-        data = request.get_json()
-        order = data.get('data', {}).get('order', {})
-        
-        if not order:
-            print(f"Webhook received non-order event: {data.get('type')}")
-            return jsonify({"status": "ok", "message": "Non-order event received"}), 200
-
-        order_status = order.get('order_status')
-        order_id = order.get('order_id')
-        user_id_str = order.get('customer_details', {}).get('customer_id')
-
-        print(f"Processing webhook for Order ID: {order_id}, Status: {order_status}, User: {user_id_str}")
-
-        if order_status == 'PAID':
-            # Check if transaction is already processed to prevent duplication
-            if transactions_collection.find_one({"type": "deposit", "associated_id": order_id}):
-                print(f"Order {order_id} already processed. Skipping.")
-                return jsonify({"status": "already_processed"}), 200
-
-            amount = float(order['order_amount'])
-            user_id = ObjectId(user_id_str)
-            
-            # Update user's balance and log the transaction
-            users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': amount}})
-            log_transaction(user_id, amount, 'deposit', 'Deposit via Cashfree', order_id)
-            print(f"Credited ₹{amount} to user {user_id_str} for order {order_id}")
-
-            # Notify user via WebSocket if they are connected
-            user_session_id = get_user_sid(str(user_id))
-            if user_session_id:
-                user = users_collection.find_one({'_id': user_id})
-                socketio.emit('personal_update', {'message': f"₹{amount:.2f} added to your wallet.", 'balance': user['wallet']['balance']}, room=user_session_id)
-
-        elif order_status in ['FAILED', 'REFUNDED']:
-            amount = float(order['order_amount'])
-            user_id = ObjectId(user_id_str)
-            log_transaction(user_id, amount, 'deposit_failed', f"Payment failed/refunded for order {order_id}", order_id)
-            
-            # Notify user via WebSocket if they are connected
-            user_session_id = get_user_sid(str(user_id))
-            if user_session_id:
-                socketio.emit('personal_update', {'message': f"Your payment of ₹{amount:.2f} did not complete. Please try again."}, room=user_session_id)
-        else:
-            print(f"Received unhandled order status: {order_status}")
+        data = json.loads(payload)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid payload"}), 400
 
-        return jsonify({"status": "success"}), 200
+    try:
+        webhook_inbox_collection.insert_one({
+            'event_key': webhook_event_key(data, payload),
+            'payload': payload,
+            'status': 'pending',
+            'attempts': 0,
+            'received_at': datetime.now()
+        })
+    except DuplicateKeyError:
+        return jsonify({"status": "already_received"}), 200
 
-    except Exception as e:
-        print(f"🔥 Webhook processing error: {str(e)}")
-        return jsonify({"status": "error", "message": "Internal Server Error"}), 500
+    webhook_wakeup.set()
+    return jsonify({"status": "accepted"}), 200
 
 
 # New route to handle the return from Cashfree and verify payment status
@@ -690,24 +1389,17 @@ def payment_complete():
         flash("Payment completed, but no order reference was found.", "warning")
         return redirect(url_for('hub'))
 
-    headers = {
-        "x-api-version": app.config['CASHFREE_API_VERSION'],
-        "x-client-id": app.config['CASHFREE_CLIENT_ID'],
-        "x-client-secret": app.config['CASHFREE_CLIENT_SECRET']
-    }
-    
     try:
-        response = requests.get(f"{CASHFREE_API_URL}/orders/{order_id}", headers=headers)
-        if response.status_code == 200:
-            order_data = response.json()
-            if order_data.get('order_status') == 'PAID':
-                flash("Your payment was successful!", "success")
-            elif order_data.get('order_status') == 'ACTIVE':
-                 flash("Your payment is pending. It will be updated shortly.", "info")
-            else:
-                flash(f"Payment status: {order_data.get('order_status')}. Please contact support if this is an error.", "warning")
+        order_data = cashfree_client.get_order(order_id)
+        if order_data.get('order_status') == 'PAID':
+            flash("Your payment was successful!", "success")
+        elif order_data.get('order_status') == 'ACTIVE':
+             flash("Your payment is pending. It will be updated shortly.", "info")
         else:
-            flash("Could not verify payment status at this time.", "warning")
+            flash(f"Payment status: {order_data.get('order_status')}. Please contact support if this is an error.", "warning")
+    except requests.exceptions.RequestException as e:
+        print(f"Payment verification API error: {str(e)}")
+        flash("Could not verify payment status at this time.", "warning")
     except Exception as e:
         print(f"Payment verification API error: {str(e)}")
         flash("There was an error verifying your payment status.", "error")
@@ -738,20 +1430,12 @@ def request_withdrawal():
     try:
         with client.start_session() as db_session:
             with db_session.start_transaction():
-                user = users_collection.find_one({'_id': user_id}, session=db_session)
-                
-                if user['wallet']['balance'] < amount:
+                # 1. Deduct from user wallet (only if the balance covers it)
+                if wallet.debit(user_id, amount, session=db_session) is None:
                     flash("Insufficient funds for this withdrawal.", "error")
                     # No need to abort, transaction will auto-abort on exiting 'with' block without commit
                     return redirect(request.referrer or url_for('hub'))
                 
-                # 1. Deduct from user wallet
-                users_collection.update_one(
-                    {'_id': user_id},
-                    {'$inc': {'wallet.balance': -amount}},
-                    session=db_session
-                )
-                
                 # 2. Create withdrawal record
                 req = {'user_id': user_id, 'amount': amount, 'upi_id': upi_id, 'status': 'pending', 'requested_at': datetime.now()}
                 req_id = withdrawals_collection.insert_one(req, session=db_session).inserted_id
@@ -763,6 +1447,8 @@ def request_withdrawal():
     except Exception as e:
         print(f"Withdrawal transaction failed: {e}")
         flash("An error occurred while submitting your request. Please try again.", "error")
+    # The debit ran inside the transaction, so the cached balance is dropped only now.
+    user_cache.invalidate(user_id)
 
     return redirect(request.referrer or url_for('hub'))
 
@@ -793,33 +1479,28 @@ def admin_logout():
 def admin_dashboard(page):
     data = {}
     if page == 'dashboard':
-        total_bets = sum(t.get('amount', 0) for t in transactions_collection.find({'type': 'bet'}))
-        total_wins = sum(t.get('amount', 0) for t in transactions_collection.find({'type': 'win'}))
-        total_deposits = sum(t.get('amount', 0) for t in transactions_collection.find({'type': 'deposit'}))
-        approved_withdrawals = withdrawals_collection.find({'status': 'approved'})
-        total_withdrawals = sum(w.get('amount', 0) for w in approved_withdrawals)
-
-        data['total_games'] = games_collection.count_documents({})
-        data['total_aviator_games'] = aviator_games_collection.count_documents({})
-        data['total_users'] = users_collection.count_documents({})
+        totals = (rollups_collection.find_one({'_id': 'all'}) or {}).get('totals', {})
+        total_bets = totals.get('bet', 0)
+        total_wins = totals.get('win', 0)
+        total_deposits = totals.get('deposit', 0)
+        total_withdrawals = totals.get('withdrawals_approved', 0)
+
+        data['total_games'] = games_collection.estimated_document_count()
+        data['total_aviator_games'] = aviator_games_collection.estimated_document_count()
+        data['total_users'] = users_collection.estimated_document_count()
         data['pending_withdrawals'] = withdrawals_collection.count_documents({'status': 'pending'})
         data['net_profit'] = abs(total_bets) - total_wins
         data['total_deposits'] = total_deposits
         data['total_withdrawals'] = total_withdrawals
 
     elif page == 'users':
-        data['all_users'] = list(users_collection.find())
+        data.update(load_users_page(request.args))
     elif page == 'game_results':
         data['game_history'] = list(games_collection.find().sort('timestamp', DESCENDING).limit(100))
     elif page == 'aviator_history':
         data['aviator_history'] = list(aviator_games_collection.find().sort('timestamp', DESCENDING).limit(100))
     elif page == 'withdrawals':
-        pipeline = [
-            {'$sort': {'requested_at': -1}},
-            {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user_details'}},
-            {'$unwind': '$user_details'}
-        ]
-        data['requests'] = list(withdrawals_collection.aggregate(pipeline))
+        data.update(load_withdrawals_page(request.args))
     elif page == 'control':
         data['preset_colors'] = list(preset_results_collection.find({"game_type": "color"}).sort('created_at', 1))
         data['preset_aviators'] = list(preset_results_collection.find({"game_type": "aviator"}).sort('created_at', 1))
@@ -830,17 +1511,162 @@ def admin_dashboard(page):
     return render_template('admin.html', page=page, data=data, partial_template=template_to_render)
 
 
+ADMIN_PAGE_SIZE = 50
+USER_LIST_PROJECTION = {'mobile': 1, 'email': 1, 'wallet.balance': 1, 'status': 1}
+
+def load_users_page(args):
+    """One keyset page of users filtered by mobile prefix, status and balance.
+
+    Each filter set is paged in the order of the index that serves it, so no page needs
+    an in-memory sort: mobile order for a prefix search, highest balance first for a
+    balance range, newest first otherwise."""
+    filters = {'q': args.get('q', '').strip(), 'status': args.get('status', ''),
+               'min_balance': args.get('min_balance', ''), 'max_balance': args.get('max_balance', '')}
+    query = {}
+    if filters['status'] == 'active':
+        query['status'] = {'$ne': 'blocked'}
+    elif filters['status'] == 'blocked':
+        query['status'] = 'blocked'
+    balance = {}
+    try:
+        if filters['min_balance']:
+            balance['$gte'] = float(filters['min_balance'])
+        if filters['max_balance']:
+            balance['$lte'] = float(filters['max_balance'])
+    except ValueError:
+        flash("Balance filters must be numbers.", "error")
+    if balance:
+        query['wallet.balance'] = balance
+    after = args.get('after', '')
+
+    if filters['q']:
+        # Anchored prefix regex on the unique mobile index, paged by mobile.
+        query['mobile'] = {'$regex': f"^{re.escape(filters['q'])}"}
+        if after:
+            query['mobile']['$gt'] = after
+        sort = [('mobile', ASCENDING)]
+        cursor_of = lambda user: user['mobile']
+    elif balance:
+        # Paged on (wallet.balance, _id), like the withdrawals queue's (requested_at, _id) cursor.
+        last_balance, _, last_id = after.rpartition('_')
+        try:
+            last_balance = float(last_balance)
+        except ValueError:
+            last_balance = None
+        if last_balance is not None and ObjectId.is_valid(last_id):
+            query['$or'] = [
+                {'wallet.balance': {'$lt': last_balance}},
+                {'wallet.balance': last_balance, '_id': {'$lt': ObjectId(last_id)}},
+            ]
+        sort = [('wallet.balance', DESCENDING), ('_id', DESCENDING)]
+        cursor_of = lambda user: f"{user['wallet']['balance']!r}_{user['_id']}"
+    else:
+        if ObjectId.is_valid(after):
+            query['_id'] = {'$lt': ObjectId(after)}
+        sort = [('_id', DESCENDING)]
+        cursor_of = lambda user: str(user['_id'])
+
+    users = list(users_collection.find(query, USER_LIST_PROJECTION).sort(sort).limit(ADMIN_PAGE_SIZE + 1))
+    next_cursor = cursor_of(users[ADMIN_PAGE_SIZE - 1]) if len(users) > ADMIN_PAGE_SIZE else None
+    return {'all_users': users[:ADMIN_PAGE_SIZE], 'next_cursor': next_cursor, 'filters': filters}
+
+WITHDRAWAL_STATUSES = ('pending', 'approved', 'rejected')
+
+def load_withdrawals_page(args):
+    """One keyset page of withdrawal requests (newest first) for a status, pending by default.
+    The cursor is the last row's requested_at and _id, so equal timestamps are not skipped."""
+    status = args.get('status', 'pending')
+    match = {'status': status} if status in WITHDRAWAL_STATUSES else {}
+    cursor = args.get('before', '')
+    if '_' in cursor:
+        timestamp, _, last_id = cursor.rpartition('_')
+        try:
+            requested_at = datetime.fromisoformat(timestamp)
+        except ValueError:
+            requested_at = None
+        if requested_at and ObjectId.is_valid(last_id):
+            match['$or'] = [
+                {'requested_at': {'$lt': requested_at}},
+                {'requested_at': requested_at, '_id': {'$lt': ObjectId(last_id)}},
+            ]
+
+    requests_page = list(withdrawals_collection.aggregate([
+        {'$match': match},
+        {'$sort': {'requested_at': -1, '_id': -1}},
+        {'$limit': ADMIN_PAGE_SIZE + 1},
+        # Joined after the limit, and only the fields the page shows. Rows whose user is gone
+        # are kept, so the extra row that signals a next page is never dropped.
+        {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id',
+                     'pipeline': [{'$project': {'mobile': 1, 'name': 1}}], 'as': 'user_details'}},
+        {'$unwind': {'path': '$user_details', 'preserveNullAndEmptyArrays': True}}
+    ]))
+    next_cursor = None
+    if len(requests_page) > ADMIN_PAGE_SIZE:
+        last = requests_page[ADMIN_PAGE_SIZE - 1]
+        next_cursor = f"{last['requested_at'].isoformat()}_{last['_id']}"
+    return {'requests': requests_page[:ADMIN_PAGE_SIZE], 'next_cursor': next_cursor,
+            'status': status if status in WITHDRAWAL_STATUSES else 'all'}
+
+WITHDRAWAL_ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+
+def process_withdrawals(request_ids, action):
+    """Approves or rejects pending withdrawal requests as a batch and returns how many were processed.
+
+    The status change is one conditional update_many tagged with a batch id, so a request
+    already handled by another admin (or a double submit) is never refunded or logged twice.
+    Rejected amounts go back to the wallets in one bulk write."""
+    status = WITHDRAWAL_ACTIONS[action]
+    batch_id = ObjectId()
+    withdrawals_collection.update_many(
+        {'_id': {'$in': request_ids}, 'status': 'pending'},
+        {'$set': {'status': status, 'processed_at': datetime.now(), 'batch_id': batch_id}}
+    )
+    processed = list(withdrawals_collection.find({'_id': {'$in': request_ids}, 'batch_id': batch_id}, {'user_id': 1, 'amount': 1}))
+    if not processed:
+        return 0
+
+    rollup_withdrawal_status(status, sum(w['amount'] for w in processed), len(processed))
+    if action == 'approve':
+        transactions = [build_transaction(w['user_id'], -w['amount'], 'withdrawal_approved', 'Withdrawal approved by admin', w['_id'])
+                        for w in processed]
+    else:
+        refunds = {}
+        for w in processed:
+            refunds[w['user_id']] = refunds.get(w['user_id'], 0) + w['amount']
+        wallet.credit_many(refunds)
+        transactions = [build_transaction(w['user_id'], w['amount'], 'withdrawal_refund', 'Withdrawal rejected and refunded', w['_id'])
+                        for w in processed]
+    ledger_writer.write(transactions)
+    return len(processed)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this worker. Needs an admin session or the METRICS_TOKEN bearer token."""
+    token = os.getenv('METRICS_TOKEN')
+    has_token = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    if 'admin_id' not in session and not has_token:
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/api/cache_stats')
+@admin_login_required
+def admin_cache_stats():
+    """Hit rate and staleness of the per-worker user cache."""
+    return jsonify(user_cache.stats())
+
+
 # --- ADMIN ACTION ROUTES ---
 @app.route('/admin/action/set_presets', methods=['POST'])
 @admin_login_required
 def admin_set_presets():
     game_type = request.form.get('game_type')
-    preset_results_collection.delete_many({"game_type": game_type})
+    presets = []
     if game_type == 'color':
         outcomes = request.form.getlist('color_outcome')
         for outcome in outcomes:
             if outcome:
-                preset_results_collection.insert_one({"game_type": "color", "outcome": outcome, "used": False, "created_at": datetime.now()})
+                presets.append({"game_type": "color", "outcome": outcome, "used": False, "created_at": datetime.now()})
     elif game_type == 'aviator':
         outcomes = request.form.getlist('aviator_outcome')
         for outcome in outcomes:
@@ -848,9 +1674,11 @@ def admin_set_presets():
                 try:
                     val = float(outcome)
                     if val >= 1.0:
-                        preset_results_collection.insert_one({"game_type": "aviator", "outcome": val, "used": False, "created_at": datetime.now()})
+                        presets.append({"game_type": "aviator", "outcome": val, "used": False, "created_at": datetime.now()})
                 except ValueError:
                     flash(f"Invalid aviator value: {outcome}", "error")
+    # Replace the whole list in one round trip; the round engine picks it up from the change stream.
+    preset_results_collection.bulk_write([DeleteMany({"game_type": game_type})] + [InsertOne(p) for p in presets], ordered=True)
     flash("Presets have been saved.", "success")
     return redirect(url_for('admin_dashboard', page='control'))
 
@@ -858,28 +1686,37 @@ def admin_set_presets():
 @admin_login_required
 def admin_process_withdrawal(request_id):
     action = request.form.get('action')
-    withdrawal_req = withdrawals_collection.find_one({'_id': ObjectId(request_id)})
-    if not withdrawal_req:
-        flash("Request not found.", "error")
+    if action not in WITHDRAWAL_ACTIONS or not ObjectId.is_valid(request_id):
+        flash("Invalid request.", "error")
         return redirect(url_for('admin_dashboard', page='withdrawals'))
-    
-    if withdrawal_req['status'] != 'pending':
-        flash("This request has already been processed.", "warning")
-        return redirect(url_for('admin_dashboard', page='withdrawals'))
-
 
-    if action == 'approve':
-        withdrawals_collection.update_one({'_id': ObjectId(request_id)}, {'$set': {'status': 'approved', 'processed_at': datetime.now()}})
-        log_transaction(withdrawal_req['user_id'], -withdrawal_req['amount'], 'withdrawal_approved', 'Withdrawal approved by admin', ObjectId(request_id))
+    if not process_withdrawals([ObjectId(request_id)], action):
+        flash("This request was not found or has already been processed.", "warning")
+    elif action == 'approve':
         flash("Withdrawal approved.", "success")
-    elif action == 'reject':
-        withdrawals_collection.update_one({'_id': ObjectId(request_id)}, {'$set': {'status': 'rejected', 'processed_at': datetime.now()}})
-        # Refund the money to the user's wallet
-        users_collection.update_one({'_id': withdrawal_req['user_id']}, {'$inc': {'wallet.balance': withdrawal_req['amount']}})
-        log_transaction(withdrawal_req['user_id'], withdrawal_req['amount'], 'withdrawal_refund', 'Withdrawal rejected and refunded', ObjectId(request_id))
+    else:
         flash("Withdrawal rejected and amount refunded to user.", "warning")
     return redirect(url_for('admin_dashboard', page='withdrawals'))
 
+@app.route('/admin/action/process_withdrawals', methods=['POST'])
+@admin_login_required
+def admin_process_withdrawals():
+    action = request.form.get('action')
+    request_ids = [ObjectId(i) for i in request.form.getlist('request_ids') if ObjectId.is_valid(i)]
+    if action not in WITHDRAWAL_ACTIONS or not request_ids:
+        flash("Select at least one request and an action.", "error")
+        return redirect(url_for('admin_dashboard', page='withdrawals'))
+
+    count = process_withdrawals(request_ids, action)
+    skipped = len(request_ids) - count
+    message = f"{count} withdrawal(s) {WITHDRAWAL_ACTIONS[action]}."
+    if action == 'reject':
+        message += " Amounts refunded to users."
+    if skipped:
+        message += f" {skipped} already processed."
+    flash(message, "success" if action == 'approve' else "warning")
+    return redirect(url_for('admin_dashboard', page='withdrawals'))
+
 @app.route('/admin/action/toggle_user_status/<user_id>', methods=['POST'])
 @admin_login_required
 def admin_toggle_user_status(user_id):
@@ -887,6 +1724,7 @@ def admin_toggle_user_status(user_id):
     if user:
         new_status = 'blocked' if user.get('status', 'active') == 'active' else 'active'
         users_collection.update_one({'_id': ObjectId(user_id)}, {'$set': {'status': new_status}})
+        user_cache.patch(ObjectId(user_id), {'status': new_status})
         flash(f"User status changed to {new_status}.", "success")
     return redirect(url_for('admin_dashboard', page='users'))
 
@@ -898,8 +1736,8 @@ def admin_add_bonus():
         user_id = ObjectId(user_id_str)
         bonus_amount = float(request.form.get('bonus_amount'))
         if bonus_amount > 0:
-            users_collection.update_one({'_id': user_id}, {'$inc': {'wallet.balance': bonus_amount}})
-            log_transaction(user_id, bonus_amount, 'deposit', f"Admin bonus of {bonus_amount}", session.get('admin_id'))
+            wallet.credit(user_id, bonus_amount)
+            log_transaction(user_id, bonus_amount, 'deposit', f"Admin bonus of {bonus_amount}", ObjectId(session['admin_id']))
             flash(f"Added ₹{bonus_amount:.2f} bonus.", "success")
         else:
             flash("Bonus amount must be positive.", "error")
@@ -908,9 +1746,50 @@ def admin_add_bonus():
     return redirect(url_for('admin_dashboard', page='users'))
 
 
+# --- CLI Commands ---
+@app.cli.command('migrate')
+def migrate_command():
+    """Create indexes and seed the default admin."""
+    bootstrap_database()
+
+
+@app.cli.command('rebuild-rollups')
+@click.option('--include-open-days', is_flag=True, help="Also rebuild today and yesterday. Pause money-moving writes first.")
+def rebuild_rollups_command(include_open_days):
+    """Recompute the admin dashboard rollups from raw history."""
+    days = rebuild_rollups(include_open_days)
+    print(f"✅ Rebuilt financial rollups for {days} day(s).")
+
+
+@app.cli.command('verify-indexes')
+def verify_indexes_command():
+    """Fail if any hot-path query plan uses a collection scan. Read-only: run
+    'flask migrate' first to create the indexes."""
+    offenders = verify_query_plans(db)
+    for name, query, sort in offenders:
+        print(f"❌ COLLSCAN on '{name}': filter={query} sort={sort}")
+    if offenders:
+        raise SystemExit(1)
+    print("✅ Every hot-path query uses an index.")
+
+
+# --- App Factory ---
+def create_app(start_background=True):
+    """Prepares this process to serve and returns the app. gunicorn calls it once per
+    worker ('app:create_app()'), so the round engine is running before the first request.
+    Importing the module alone (CLI commands, benchmarks) starts nothing."""
+    if not app.config.get('STARTED'):
+        app.config['STARTED'] = True
+        ledger_writer.start()
+        atexit.register(ledger_writer.close)
+        if start_background:
+            start_background_tasks()
+    return app
+
+
 # --- Main Execution ---
 if __name__ == '__main__':
     # For production deployment, use a WSGI server like Gunicorn or uWSGI instead of Flask's built-in server.
     # The 'debug' flag should ALWAYS be set to False in a production environment.
     port = int(os.environ.get("PORT", 5000))
-    socketio.run(app, host='0.0.0.0', port=port, debug=False)
+    socketio.run(create_app(), host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,107 @@
+"""Offline latency benchmark for cashfree.CashfreeClient against a local mock gateway.
+
+The mock answers POST /orders and GET /orders/<id> after a configurable delay and can
+fail a fraction of requests with 503 or stall past the read timeout. Run it from the
+repository root:
+
+    python benchmarks/cashfree_mock.py --requests 200 --latency 0.05 --fail-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+from cashfree import CashfreeClient, CircuitBreaker  # noqa: E402
+
+
+def make_handler(latency, fail_rate, stall_rate, stall_seconds):
+    class MockCashfreeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, body):
+            time.sleep(latency)
+            roll = random.random()
+            if roll < stall_rate:
+                time.sleep(stall_seconds)
+            if roll < fail_rate:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            order = json.loads(self.rfile.read(length) or b'{}')
+            self._respond({'order_id': order.get('order_id'), 'payment_session_id': 'session_mock'})
+
+        def do_GET(self):
+            self._respond({'order_id': self.path.rsplit('/', 1)[-1], 'order_status': 'PAID'})
+
+    return MockCashfreeHandler
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(args):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency, args.fail_rate, args.stall_rate, args.read_timeout * 2))
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/pg"
+
+    client = CashfreeClient(base_url, 'mock-id', 'mock-secret', '2022-09-01',
+                            read_timeout=args.read_timeout, max_retries=args.retries,
+                            breaker=CircuitBreaker(threshold=args.breaker_threshold, reset_timeout=1))
+    results = {}
+    for name, call in (('create_order', lambda i: client.create_order({'order_id': f'order_{i}'})),
+                       ('get_order', lambda i: client.get_order(f'order_{i}'))):
+        latencies, errors, fast_fails = [], 0, 0
+        for i in range(args.requests):
+            started = time.perf_counter()
+            try:
+                call(i)
+            except requests.exceptions.RequestException as e:
+                errors += 1
+                fast_fails += 'circuit is open' in str(e)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            'requests': args.requests,
+            'errors': errors,
+            'circuit_fast_fails': fast_fails,
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2),
+        }
+    server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='mock gateway latency in seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='fraction of requests that exceed the read timeout')
+    parser.add_argument('--read-timeout', type=float, default=1.0)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--breaker-threshold', type=int, default=5)
+    print(json.dumps(run(parser.parse_args()), indent=2))
@@ -0,0 +1,89 @@
+"""Import-time benchmark for app.py.
+
+Imports the app in a fresh interpreter several times with `python -X importtime` and
+reports the wall time of `import app` plus the slowest modules by cumulative import
+time. Importing must not touch the network, so MONGO_URI points at an unroutable
+address by default; a regression that connects at import time shows up as a stall.
+Run it from the repository root:
+
+    python benchmarks/import_time.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def import_once(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    process_seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"Importing app failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        modules[name.strip()] = int(cumulative_us)
+    return float(result.stdout.strip().splitlines()[-1]), process_seconds, modules
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    env = dict(os.environ, MONGO_URI=args.mongo_uri, ASYNC_MODE=args.async_mode, FLASK_ENV='development')
+    import_seconds, process_seconds, slowest = [], [], {}
+    for _ in range(args.runs):
+        imported, process, modules = import_once(env)
+        import_seconds.append(imported)
+        process_seconds.append(process)
+        for name, cumulative in modules.items():
+            slowest[name] = max(slowest.get(name, 0), cumulative)
+    top = sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    return {
+        'commit': current_commit(),
+        'runs': args.runs,
+        'async_mode': args.async_mode,
+        'import_app_ms': {
+            'median': round(statistics.median(import_seconds) * 1000, 1),
+            'max': round(max(import_seconds) * 1000, 1),
+        },
+        'interpreter_total_ms': {
+            'median': round(statistics.median(process_seconds) * 1000, 1),
+            'max': round(max(process_seconds) * 1000, 1),
+        },
+        'slowest_modules_ms': {name: round(us / 1000, 1) for name, us in top},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--async-mode', default='threading', choices=['threading', 'eventlet'])
+    parser.add_argument('--mongo-uri', default='mongodb://10.255.255.1:27017/?serverSelectionTimeoutMS=2000')
+    parser.add_argument('--output', help='defaults to benchmarks/results/import_time-<commit>.json')
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"import_time-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
@@ -0,0 +1,285 @@
+"""Offline load test for betting and round settlement.
+
+Boots app.py in-process against a local mongod, using a throwaway database that is
+dropped afterwards. Simulated players register through the Flask test client and
+connect Socket.IO test clients. Rounds are driven by publishing round state directly
+instead of running the round engine, so a round lasts as long as its requests rather
+than 30 seconds. Each round calls the same finish_color_round/finish_aviator_round
+the engine uses. Run it from the repository root:
+
+    python benchmarks/load_test.py --users 5000 --rounds 5 --concurrency 64
+
+Results are written as JSON (by default benchmarks/results/load_test-<commit>.json)
+so runs can be compared between commits.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pymongo import monitoring  # noqa: E402
+
+BASE_URL = 'https://localhost'  # session cookies are Secure, so requests go over "https"
+COLORS = ['red', 'green', 'violet']
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands by name and collection, e.g. 'update:users'."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = Lock()
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        key = f"{event.command_name}:{target}" if isinstance(target, str) else event.command_name
+        with self._lock:
+            self.counts[key] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def take(self):
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.rejected = Counter()
+        self._lock = Lock()
+
+    def call(self, name, fn):
+        started = time.perf_counter()
+        response = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        body = response.get_json(silent=True) or {}
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if response.status_code >= 400 or body.get('status') == 'error':
+                self.rejected[name] += 1
+        return response
+
+    def report(self):
+        return {name: {'requests': len(samples), 'rejected': self.rejected[name], **summarize(samples)}
+                for name, samples in self.latencies.items()}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    if not samples:
+        return {}
+    return {
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+
+def boot_app(args, counter):
+    os.environ.update({
+        'MONGO_URI': args.mongo_uri,
+        'MONGO_DB': args.db,
+        'ASYNC_MODE': 'threading',
+        'MULTI_WORKER': 'false',
+        'LEDGER_WRITE_BEHIND': 'true' if args.write_behind else 'false',
+        'LEDGER_JOURNAL_PATH': os.path.join(tempfile.mkdtemp(), 'ledger_journal.jsonl'),
+    })
+    os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
+    monitoring.register(counter)
+    import app as game_app
+    game_app.client.admin.command('ping')
+    game_app.bootstrap_database()
+    # Only the ledger writer; the round engine stays off so the harness drives the rounds.
+    game_app.create_app(start_background=False)
+    return game_app
+
+
+def register_players(game_app, recorder, args):
+    def register(i):
+        client = game_app.app.test_client()
+        mobile = f"7{i:09d}"
+        recorder.call('register', lambda: client.post('/register', base_url=BASE_URL, data={
+            'name': f'Player {i}', 'mobile': mobile, 'password': 'benchmark', 'email': f'player{i}@example.com'}))
+        user = game_app.users_collection.find_one({'mobile': mobile}, {'_id': 1})
+        # Enough balance for every round's bets; not part of the measurement.
+        game_app.wallet.credit(user['_id'], args.bet_amount * args.rounds * 4)
+        return client
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        clients = list(pool.map(register, range(args.users)))
+    sockets = [game_app.socketio.test_client(game_app.app, flask_test_client=c) for c in clients[:args.sockets]]
+    # Half the sockets watch each game, as the two game pages would.
+    for i, socket_client in enumerate(sockets):
+        socket_client.emit('color_join' if i % 2 == 0 else 'aviator_join')
+    return clients, sockets
+
+
+def fan_out(game_app, sockets, event, payload, room):
+    for socket_client in sockets:
+        socket_client.get_received()
+    started = time.perf_counter()
+    game_app.socketio.emit(event, payload, room=room)
+    elapsed = (time.perf_counter() - started) * 1000
+    received = sum(1 for s in sockets for packet in s.get_received() if packet['name'] == event)
+    return round(elapsed, 2), received
+
+
+def color_round(game_app, clients, sockets, recorder, counter, pool, args, number):
+    round_id = datetime.now().strftime('%Y%m%d%H%M%S') + f"{number:03d}"
+    game_app.round_channel.publish('color', {'phase': 'open', 'round_id': round_id,
+                                             'locks_at': time.time() + 3600, 'ends_at': time.time() + 3600})
+    counter.take()
+
+    def bet(client):
+        recorder.call('POST /bet', lambda: client.post('/bet', base_url=BASE_URL,
+                                                       json={'amount': args.bet_amount, 'color': random.choice(COLORS)}))
+    list(pool.map(bet, clients))
+    betting_ops = counter.take()
+
+    fanout_ms, recipients = fan_out(game_app, sockets, 'color_pool_update',
+                                    {'round_id': round_id, 'pools': game_app.get_color_pool(round_id)}, 'color')
+    game_app.round_channel.publish('color', {'phase': 'settling', 'round_id': round_id, 'locks_at': 0, 'ends_at': 0})
+    counter.take()
+    started = time.perf_counter()
+    payouts = game_app.finish_color_round(round_id, random.choice(COLORS))
+    settlement_ms = (time.perf_counter() - started) * 1000
+    settlement_ops = counter.take()
+    return {
+        'game': 'color', 'round_id': round_id, 'bets': len(clients), 'winners': len(payouts),
+        'settlement_ms': round(settlement_ms, 2), 'fanout_ms': fanout_ms, 'fanout_recipients': recipients,
+        'db_ops': {'betting': sum(betting_ops.values()), 'settlement': sum(settlement_ops.values()),
+                   'by_command': dict(betting_ops + settlement_ops)},
+    }
+
+
+def aviator_round(game_app, clients, sockets, recorder, counter, pool, args, number):
+    round_id = datetime.now().strftime('AV%Y%m%d%H%M%S') + f"{number:03d}"
+    state = {'status': 'waiting', 'round_id': round_id, 'crash_point': 1000.0,
+             'current_multiplier': 1.0, 'start_time': None, 'timer': 10}
+    game_app.round_channel.publish('aviator', state)
+    game_app.reset_aviator_roster(round_id)
+    counter.take()
+
+    def bet(client):
+        recorder.call('POST /api/aviator/bet', lambda: client.post('/api/aviator/bet', base_url=BASE_URL,
+                                                                   json={'amount': args.bet_amount}))
+    list(pool.map(bet, clients))
+    cancelling = random.sample(clients, int(len(clients) * args.cancel_rate))
+    list(pool.map(lambda c: recorder.call('POST /api/aviator/cancel', lambda: c.post('/api/aviator/cancel', base_url=BASE_URL)),
+                  cancelling))
+
+    game_app.round_channel.publish('aviator', {**state, 'status': 'flying', 'start_time': time.time() - 3})
+    cancelled = set(map(id, cancelling))
+    flying = [c for c in clients if id(c) not in cancelled]
+    cashing_out = random.sample(flying, int(len(flying) * args.cashout_rate))
+    list(pool.map(lambda c: recorder.call('POST /api/aviator/cashout', lambda: c.post('/api/aviator/cashout', base_url=BASE_URL)),
+                  cashing_out))
+    betting_ops = counter.take()
+
+    fanout_ms, recipients = fan_out(game_app, sockets, 'aviator_multiplier_update', {'multiplier': 1.5}, 'aviator')
+    crash_point = round(game_app.aviator_multiplier_at(3.5), 2)
+    game_app.round_channel.publish('aviator', {**state, 'status': 'crashed', 'crash_point': crash_point})
+    counter.take()
+    started = time.perf_counter()
+    game_app.finish_aviator_round(round_id, crash_point)
+    settlement_ms = (time.perf_counter() - started) * 1000
+    settlement_ops = counter.take()
+    return {
+        'game': 'aviator', 'round_id': round_id, 'bets': len(clients), 'cancelled': len(cancelling),
+        'cashed_out': len(cashing_out), 'settlement_ms': round(settlement_ms, 2),
+        'fanout_ms': fanout_ms, 'fanout_recipients': recipients,
+        'db_ops': {'betting': sum(betting_ops.values()), 'settlement': sum(settlement_ops.values()),
+                   'by_command': dict(betting_ops + settlement_ops)},
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    if args.db == 'xdhamaka_db':
+        sys.exit("Refusing to run against the application database; pass a throwaway --db.")
+    counter = CommandCounter()
+    game_app = boot_app(args, counter)
+    recorder = Recorder()
+    try:
+        clients, sockets = register_players(game_app, recorder, args)
+        rounds = []
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for number in range(args.rounds):
+                rounds.append(color_round(game_app, clients, sockets, recorder, counter, pool, args, number))
+                rounds.append(aviator_round(game_app, clients, sockets, recorder, counter, pool, args, number))
+        game_app.ledger_writer.flush()
+    finally:
+        if not args.keep_db:
+            game_app.client.drop_database(args.db)
+
+    by_game = defaultdict(lambda: defaultdict(list))
+    for r in rounds:
+        for key in ('settlement_ms', 'fanout_ms'):
+            by_game[r['game']][key].append(r[key])
+        by_game[r['game']]['db_ops_per_round'].append(r['db_ops']['betting'] + r['db_ops']['settlement'])
+    return {
+        'commit': current_commit(),
+        'ran_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('mongo_uri', 'output')},
+        'endpoints': recorder.report(),
+        'rounds_summary': {
+            game: {'settlement': summarize(m['settlement_ms']), 'fanout': summarize(m['fanout_ms']),
+                   'db_ops_per_round_avg': round(statistics.mean(m['db_ops_per_round']), 1)}
+            for game, m in by_game.items()
+        },
+        'rounds': rounds,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='game_hub_benchmark', help='throwaway database, dropped afterwards')
+    parser.add_argument('--keep-db', action='store_true')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--sockets', type=int, default=200, help='how many players also connect a Socket.IO client')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--bet-amount', type=float, default=10)
+    parser.add_argument('--cancel-rate', type=float, default=0.1)
+    parser.add_argument('--cashout-rate', type=float, default=0.5)
+    parser.add_argument('--write-behind', action='store_true', help='run with LEDGER_WRITE_BEHIND=true')
+    parser.add_argument('--output', help='defaults to benchmarks/results/load_test-<commit>.json')
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"load_test-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({'endpoints': results['endpoints'], 'rounds_summary': results['rounds_summary']}, indent=2))
+    print(f"Results written to {output}")
@@ -0,0 +1,150 @@
+"""Bytes per round and encode CPU per emit for the Socket.IO wire formats.
+
+Builds the event traffic of one color round and one aviator round (in both curve
+modes), then encodes every packet the way python-socketio does. It compares the
+current JSON text frames, msgpack alone, and msgpack with the positional
+encodings from wire.py (SOCKETIO_WIRE_FORMAT=compact). Sizes are Socket.IO packet
+payloads per receiving socket; Engine.IO and WebSocket framing add a few bytes per
+message on top. Run it from the repository root:
+
+    python benchmarks/wire_format.py --bettors 300 --crash 2.5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from socketio import packet as sio_packet  # noqa: E402
+from socketio.msgpack_packet import MsgPackPacket  # noqa: E402
+
+import wire  # noqa: E402
+
+TICK_INTERVAL = 0.1
+CHECKPOINT_INTERVAL = 1.0
+
+
+def multiplier_at(elapsed):
+    return round(1.0 + 0.05 * elapsed + 0.05 * (elapsed ** 1.5), 2)
+
+
+def bet_entry(i):
+    return {'id': f"{random.getrandbits(96):024x}", 'user': f"***{i % 10000:04d}", 'amount': float(random.choice([10, 20, 50, 100])),
+            'status': 'bet_placed'}
+
+
+def aviator_round(args, curve_mode):
+    round_id = 'AV20240101120000'
+    events = [('aviator_bet_delta', {'op': 'reset', 'round_id': round_id})]
+    bets = [bet_entry(i) for i in range(args.bettors)]
+    for i in range(10, 0, -1):
+        events.append(('aviator_state_update', {'status': 'waiting', 'timer': i, 'round_id': round_id}))
+    events += [('aviator_bet_delta', {'op': 'add', 'bet': bet}) for bet in bets]
+    events += [('aviator_bets_update', {'round_id': round_id, 'bets': bets}) for _ in range(args.joins)]
+    for bet in random.sample(bets, int(len(bets) * 0.1)):
+        events.append(('aviator_bet_delta', {'op': 'remove', 'bet': {'id': bet['id']}}))
+
+    start = 1_700_000_000.0
+    if curve_mode == 'local':
+        events.append(('aviator_state_update', {'status': 'flying', 'start_time': start, 'server_time': start}))
+    else:
+        events.append(('aviator_state_update', {'status': 'flying'}))
+    cashing_out = iter(random.sample(bets, int(len(bets) * 0.4)))
+    elapsed, last_checkpoint = 0.0, 0.0
+    while multiplier_at(elapsed) < args.crash:
+        multiplier = multiplier_at(elapsed)
+        if curve_mode == 'ticks':
+            events.append(('aviator_multiplier_update', {'multiplier': multiplier}))
+        elif elapsed - last_checkpoint >= CHECKPOINT_INTERVAL:
+            events.append(('aviator_multiplier_update', {'multiplier': multiplier, 'server_time': start + elapsed}))
+            last_checkpoint = elapsed
+        bet = next(cashing_out, None)
+        if bet is not None and random.random() < 0.5:
+            events.append(('aviator_bet_delta', {'op': 'update', 'bet': {**bet, 'status': 'cashed_out', 'cashout_multiplier': multiplier,
+                                                                         'winnings': round(bet['amount'] * multiplier, 2)}}))
+        elapsed += TICK_INTERVAL
+    events.append(('aviator_crash', {'multiplier': args.crash}))
+    events.append(('aviator_bet_delta', {'op': 'crash'}))
+    return events
+
+
+def color_round(args):
+    round_id = '20240101120000'
+    events = [('color_round_update', {'phase': 'open', 'round_id': round_id, 'locks_at': 1_700_000_025.0,
+                                      'ends_at': 1_700_000_030.0, 'next_round_at': None, 'server_time': 1_700_000_000.0})]
+    totals = {c: {'amount': 0.0, 'bettors': 0} for c in wire.COLORS}
+    for _ in range(26):
+        for color in wire.COLORS:
+            totals[color]['amount'] += random.randint(0, args.bettors) * 10.0
+            totals[color]['bettors'] += random.randint(0, args.bettors // 25 + 1)
+        events.append(('color_pool_update', {'round_id': round_id, 'pools': {c: dict(v) for c, v in totals.items()}}))
+    events.append(('color_round_update', {'phase': 'locked', 'round_id': round_id, 'locks_at': 1_700_000_025.0,
+                                          'ends_at': 1_700_000_030.0, 'next_round_at': None, 'server_time': 1_700_000_025.0}))
+    events.append(('new_result', {'round_id': round_id, 'result_color': 'green'}))
+    return events
+
+
+def json_frame(event, data):
+    return sio_packet.Packet(sio_packet.EVENT, data=[event, data], namespace='/').encode().encode()
+
+
+def msgpack_frame(event, data):
+    return MsgPackPacket(sio_packet.EVENT, data=[event, data], namespace='/').encode()
+
+
+FORMATS = {
+    'json': lambda event, data: json_frame(event, data),
+    'msgpack': lambda event, data: msgpack_frame(event, data),
+    'compact': lambda event, data: msgpack_frame(event, wire.encode(event, data)),
+}
+
+
+def measure(events, encode, repeat):
+    size = sum(len(encode(event, data)) for event, data in events)
+    started = time.process_time()
+    for _ in range(repeat):
+        for event, data in events:
+            encode(event, data)
+    cpu = time.process_time() - started
+    return size, cpu / (repeat * len(events)) * 1e6
+
+
+def run(args):
+    random.seed(args.seed)
+    rounds = {
+        'color': color_round(args),
+        'aviator_local_curve': aviator_round(args, 'local'),
+        'aviator_ticks': aviator_round(args, 'ticks'),
+    }
+    results = {}
+    for name, events in rounds.items():
+        per_format = {}
+        for format_name, encode in FORMATS.items():
+            size, cpu_us = measure(events, encode, args.repeat)
+            per_format[format_name] = {'bytes_per_round': size, 'encode_cpu_us_per_emit': round(cpu_us, 2)}
+        baseline = per_format['json']['bytes_per_round']
+        for stats in per_format.values():
+            stats['bytes_vs_json'] = f"{(stats['bytes_per_round'] / baseline - 1) * 100:+.1f}%"
+        results[name] = {'emits': len(events), **per_format}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bettors', type=int, default=200)
+    parser.add_argument('--joins', type=int, default=20, help='roster snapshots sent to sockets joining mid-round')
+    parser.add_argument('--crash', type=float, default=2.5)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,100 @@
+import random
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network while the gateway is considered down."""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets one trial call through
+    once `reset_timeout` seconds have passed."""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Payment gateway circuit is open.")
+            # Half-open: let this call through, and re-open immediately if it fails.
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class CashfreeClient:
+    """Cashfree PG API client with a keep-alive connection pool, connect/read timeouts,
+    jittered retries for idempotent GETs and a circuit breaker.
+
+    HTTP errors are raised as requests exceptions (CircuitOpenError included), so
+    callers can keep catching requests.exceptions.RequestException.
+    """
+
+    def __init__(self, base_url, client_id, client_secret, api_version,
+                 connect_timeout=3.05, read_timeout=10, max_retries=2, backoff=0.25,
+                 pool_size=20, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers.update({
+            "x-api-version": api_version,
+            "x-client-id": client_id or '',
+            "x-client-secret": client_secret or ''
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def create_order(self, payload):
+        """POST /orders. Not retried: a duplicate attempt could create a second order."""
+        response = self._request('POST', '/orders', retries=0, json=payload)
+        return response.json()
+
+    def get_order(self, order_id):
+        """GET /orders/<order_id>."""
+        response = self._request('GET', f'/orders/{order_id}', retries=self.max_retries)
+        return response.json()
+
+    def _request(self, method, path, retries, **kwargs):
+        self.breaker.before_call()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError):
+                if attempt >= retries:
+                    self.breaker.record_failure()
+                    raise
+                # Full jitter keeps retries from many workers from arriving in lockstep.
+                time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            response.raise_for_status()
+            return response
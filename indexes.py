@@ -0,0 +1,128 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+# Every index the app relies on, by collection. ensure_indexes() creates them and
+# HOT_QUERIES below lists the queries they exist for.
+INDEXES = {
+    'users': [
+        IndexModel([('mobile', ASCENDING)], unique=True),
+        # Admin users page: status filter with keyset pagination on _id
+        IndexModel([('status', ASCENDING), ('_id', DESCENDING)]),
+        # Admin users page: balance range filter with keyset pagination on (balance, _id)
+        IndexModel([('wallet.balance', DESCENDING), ('_id', DESCENDING)]),
+    ],
+    'transactions': [
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('timestamp', DESCENDING)]),
+        IndexModel([('type', ASCENDING), ('associated_id', ASCENDING)]),
+        # Prevents crediting the same payment webhook twice. It only covers gateway
+        # deposits (string order ids), so batched win/bet entries sharing a round_id
+        # can be inserted together.
+        IndexModel([('associated_id', ASCENDING)], name='deposit_associated_id_unique', unique=True,
+                   partialFilterExpression={'type': 'deposit', 'associated_id': {'$type': 'string'}}),
+    ],
+    'withdrawals': [
+        IndexModel([('user_id', ASCENDING)]),
+        # Admin withdrawals queue: status filter with keyset pagination on requested_at.
+        # Its status prefix also serves the dashboard's pending count.
+        IndexModel([('status', ASCENDING), ('requested_at', DESCENDING), ('_id', DESCENDING)]),
+        # The queue's "all" tab: the same keyset order without a status filter
+        IndexModel([('requested_at', DESCENDING), ('_id', DESCENDING)]),
+    ],
+    'games': [
+        IndexModel([('timestamp', DESCENDING)]),
+    ],
+    'aviator_games': [
+        IndexModel([('timestamp', DESCENDING)]),
+    ],
+    'bets': [
+        IndexModel([('round_id', ASCENDING), ('color', ASCENDING)]),
+    ],
+    'aviator_bets': [
+        # One bet per user per round; place_aviator_bet relies on it instead of a pre-check.
+        IndexModel([('user_id', ASCENDING), ('round_id', ASCENDING)], name='user_round_unique', unique=True),
+        IndexModel([('round_id', ASCENDING), ('status', ASCENDING)]),
+    ],
+    'preset_results': [
+        IndexModel([('game_type', ASCENDING), ('used', ASCENDING), ('created_at', ASCENDING)]),
+    ],
+    'webhook_inbox': [
+        # Deduplicates gateway retries at ingestion and lets workers claim the oldest pending event
+        IndexModel([('event_key', ASCENDING)], unique=True),
+        IndexModel([('status', ASCENDING), ('received_at', ASCENDING)]),
+    ],
+    'bet_pools': [
+        # Per-round pool documents are only needed while the round is live
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=86400),
+    ],
+}
+
+# Indexes replaced by a differently-optioned definition above; dropped before creation.
+LEGACY_INDEXES = {
+    'transactions': ['associated_id_1', 'type_1'],
+    'withdrawals': ['status_1', 'requested_at_-1'],
+}
+
+# (collection, filter, sort) for each query on a request or round hot path.
+HOT_QUERIES = [
+    ('users', {'mobile': '9999999999'}, None),
+    ('users', {'status': 'blocked'}, [('_id', DESCENDING)]),
+    ('users', {'status': {'$ne': 'blocked'}}, [('_id', DESCENDING)]),
+    ('users', {'mobile': {'$regex': '^98'}}, [('mobile', ASCENDING)]),
+    ('users', {'wallet.balance': {'$gte': 100.0}}, [('wallet.balance', DESCENDING), ('_id', DESCENDING)]),
+    ('bets', {'round_id': '20240101000000', 'color': 'red'}, None),
+    ('aviator_bets', {'round_id': 'AV20240101000000'}, None),
+    ('aviator_bets', {'round_id': 'AV20240101000000', 'status': 'bet_placed'}, None),
+    ('aviator_bets', {'user_id': None, 'round_id': 'AV20240101000000'}, None),
+    ('aviator_bets', {'user_id': None, 'round_id': 'AV20240101000000', 'status': 'bet_placed'}, None),
+    ('preset_results', {'game_type': 'color', 'used': False}, [('created_at', ASCENDING)]),
+    ('transactions', {'type': 'deposit', 'associated_id': 'order_1'}, None),
+    ('transactions', {'user_id': None}, [('timestamp', DESCENDING)]),
+    ('withdrawals', {'status': 'pending'}, None),
+    ('withdrawals', {'status': 'pending'}, [('requested_at', DESCENDING), ('_id', DESCENDING)]),
+    ('withdrawals', {}, [('requested_at', DESCENDING), ('_id', DESCENDING)]),
+    ('games', {}, [('timestamp', DESCENDING)]),
+    ('aviator_games', {}, [('timestamp', DESCENDING)]),
+    ('webhook_inbox', {'$or': [{'status': 'pending'}, {'status': 'processing', 'locked_until': {'$lt': datetime(2024, 1, 1)}}]},
+     [('received_at', ASCENDING)]),
+    ('bet_pools', {'_id': '20240101000000'}, None),
+]
+
+
+def ensure_indexes(db):
+    """Creates every registered index. A failure on one collection (for example existing
+    duplicates under a new unique index) is reported without skipping the rest."""
+    for name, models in INDEXES.items():
+        collection = db[name]
+        try:
+            existing = collection.index_information()
+            for legacy in LEGACY_INDEXES.get(name, []):
+                if legacy in existing:
+                    collection.drop_index(legacy)
+            collection.create_indexes(models)
+        except PyMongoError as e:
+            print(f"❌ Could not ensure indexes on '{name}': {e}")
+
+
+def _stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _stages(child)
+
+
+def verify_query_plans(db):
+    """Runs explain() on every hot query and returns the ones whose winning plan uses COLLSCAN."""
+    offenders = []
+    for name, query, sort in HOT_QUERIES:
+        cursor = db[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in _stages(winning_plan):
+            offenders.append((name, query, sort))
+    return offenders
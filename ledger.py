@@ -0,0 +1,217 @@
+import fcntl
+import glob
+import os
+import socket
+from threading import Thread, Lock, Event
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class LedgerWriter:
+    """Write-behind buffer for transaction documents.
+
+    Documents are appended to a local journal (fsynced) before they are queued, so a
+    crash between enqueue and flush cannot lose entries. A background thread flushes
+    the queue with insert_many(ordered=False) whenever it reaches `max_batch` entries
+    or every `max_delay` seconds. Every document carries a pre-assigned _id, which makes
+    replaying a journal after a crash idempotent: entries that already reached Mongo
+    fail with a duplicate-key error and are skipped.
+
+    Each process journals to its own `<journal_path>.<host>-<pid>` file and holds an
+    flock on a matching `.lock` file while it runs. On start, journals whose lock is
+    free belong to a dead process and are replayed; live workers' journals are left alone.
+
+    `on_written` (the rollup update) runs after the insert and separately from it: if
+    it fails, the written documents are kept and passed to it again on the next flush,
+    and the insert itself is never repeated.
+
+    When `enabled` is False, writes go straight to the collection on the caller's thread.
+    """
+
+    def __init__(self, collection, on_written=None, journal_path='ledger_journal.jsonl',
+                 max_batch=500, max_delay=0.5, enabled=True):
+        self.collection = collection
+        self.on_written = on_written
+        self.base_path = journal_path
+        self.journal_path = None
+        self.flushing_path = None
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.enabled = enabled
+        self._buffer = []
+        self._unnotified = []
+        self._notify_lock = Lock()
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._journal = None
+        self._owner_lock = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        # Named here rather than in __init__, which may run in a master process before fork.
+        self.journal_path = f"{self.base_path}.{socket.gethostname()}-{os.getpid()}"
+        self.flushing_path = f"{self.journal_path}.flushing"
+        # Replays are serialized so two workers starting together never replay one journal twice.
+        with open(f"{self.base_path}.lock", 'a') as replay_lock:
+            fcntl.flock(replay_lock, fcntl.LOCK_EX)
+            self._replay_journals()
+            self._owner_lock = open(f"{self.journal_path}.lock", 'a')
+            fcntl.flock(self._owner_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        # Entries that could not be replayed stay queued, so they must be journaled again.
+        for doc in self._buffer:
+            self._journal.write(json_util.dumps(doc) + '\n')
+        self._journal.flush()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, docs):
+        """Queues transaction documents, or inserts them immediately when write-behind is disabled."""
+        if not docs:
+            return
+        if not self.enabled or self._stopped:
+            if len(docs) == 1:
+                self.collection.insert_one(docs[0])
+            else:
+                self.collection.insert_many(docs, ordered=False)
+            self._notify(docs)
+            return
+
+        with self._lock:
+            for doc in docs:
+                self._journal.write(json_util.dumps(doc) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._buffer.extend(docs)
+            full = len(self._buffer) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Writes everything queued so far. Failed batches are re-queued and re-journaled."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                if batch:
+                    # Rotate the journal so entries queued during the insert land in a fresh file.
+                    self._journal.close()
+                    os.replace(self.journal_path, self.flushing_path)
+                    self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            if not batch:
+                self._notify([])
+                return
+
+            try:
+                written, failed = self._insert(batch)
+            except Exception as e:
+                written, failed = [], batch
+                print(f"🔥 Ledger flush failed: {e}")
+            if failed:
+                print(f"Re-queueing {len(failed)} ledger entries.")
+                with self._lock:
+                    for doc in failed:
+                        self._journal.write(json_util.dumps(doc) + '\n')
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                    self._buffer[:0] = failed
+            os.remove(self.flushing_path)
+            self._notify(written)
+
+    def close(self):
+        """Stops the background flusher and drains the queue."""
+        if self._thread is None:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.max_delay * 4)
+        self.flush()
+        self._journal.close()
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+            os.remove(self.journal_path)
+            os.remove(f"{self.journal_path}.lock")
+        self._owner_lock.close()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Queued entries stay in the buffer and journal; the next pass retries them.
+                print(f"🔥 Ledger flusher error: {e}")
+
+    def _insert(self, batch):
+        """insert_many that treats duplicate-key errors as already-written entries.
+        Returns (newly written documents, documents that failed for any other reason)."""
+        failed = []
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            written = batch
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            duplicates = {err['index'] for err in errors if err.get('code') == DUPLICATE_KEY_ERROR}
+            failed_indexes = {err['index'] for err in errors} - duplicates
+            written = [doc for i, doc in enumerate(batch) if i not in duplicates and i not in failed_indexes]
+            failed = [batch[i] for i in sorted(failed_indexes)]
+            if duplicates:
+                print(f"Ledger flush skipped {len(duplicates)} duplicate entries.")
+        return written, failed
+
+    def _notify(self, docs):
+        """Passes newly written documents, plus any whose callback failed before, to on_written."""
+        if not self.on_written:
+            return
+        with self._notify_lock:
+            pending, self._unnotified = self._unnotified + docs, []
+            if not pending:
+                return
+            try:
+                self.on_written(pending)
+            except Exception as e:
+                print(f"🔥 Ledger on_written failed for {len(pending)} entries, retrying on the next flush: {e}")
+                self._unnotified = pending
+
+    def _replay_journals(self):
+        """Re-inserts entries left behind by processes that are no longer running.
+        Called with the replay lock held."""
+        owners = set()
+        for path in glob.glob(f"{glob.escape(self.base_path)}.*"):
+            for suffix in ('.flushing', '.lock'):
+                if path.endswith(suffix):
+                    path = path[:-len(suffix)]
+            if path != self.base_path:
+                owners.add(path)
+        # Journals written before they were per process have no owner lock.
+        self._replay(self.base_path)
+        for journal in sorted(owners):
+            with open(f"{journal}.lock", 'a') as owner_lock:
+                try:
+                    fcntl.flock(owner_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # a live worker's journal
+                self._replay(journal)
+                os.remove(f"{journal}.lock")
+
+    def _replay(self, journal):
+        for path in (f"{journal}.flushing", journal):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                docs = [json_util.loads(line) for line in f if line.strip()]
+            failed = []
+            for i in range(0, len(docs), self.max_batch):
+                written, batch_failed = self._insert(docs[i:i + self.max_batch])
+                self._notify(written)
+                failed.extend(batch_failed)
+            os.remove(path)
+            self._buffer.extend(failed)
+            if docs:
+                print(f"✅ Replayed {len(docs)} ledger entries from {path}.")
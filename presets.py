@@ -0,0 +1,80 @@
+import time
+from threading import Lock
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class PresetQueue:
+    """In-process copy of the admin's preset outcomes, one FIFO list per game type.
+
+    The queue is loaded once, then reloaded whenever a change stream on the preset
+    collection reports a change. Standalone mongod has no change streams, so in that
+    case the queue is reloaded every `poll_interval` seconds instead. pop() never
+    reads from Mongo; the consumed document is deleted in a background task.
+    """
+
+    def __init__(self, collection, start_task, sleep=time.sleep, poll_interval=5):
+        self.collection = collection
+        self.start_task = start_task
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+        self._queues = {}
+        self._consumed = set()
+        self._lock = Lock()
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.start_task(self._sync)
+
+    def reload(self):
+        queues = {}
+        for preset in self.collection.find({'used': False}).sort([('created_at', 1), ('_id', 1)]):
+            queues.setdefault(preset['game_type'], []).append(preset)
+        with self._lock:
+            self._queues = {
+                game_type: [p for p in presets if p['_id'] not in self._consumed]
+                for game_type, presets in queues.items()
+            }
+            # A consumed id that no longer comes back from Mongo has been deleted for good.
+            self._consumed &= {p['_id'] for presets in queues.values() for p in presets}
+
+    def pop(self, game_type):
+        """Returns the oldest preset outcome for a game type, or None."""
+        with self._lock:
+            queue = self._queues.get(game_type)
+            if not queue:
+                return None
+            preset = queue.pop(0)
+            self._consumed.add(preset['_id'])
+        self.start_task(lambda: self.collection.delete_one({'_id': preset['_id']}))
+        return preset.get('outcome')
+
+    def _sync(self):
+        # The first load happens here rather than in start(), so a worker does not wait on Mongo to boot.
+        self._safe_reload()
+        while True:
+            try:
+                with self.collection.watch() as stream:
+                    for _ in stream:
+                        self.reload()
+            except OperationFailure:
+                # Change streams need a replica set; fall back to polling.
+                break
+            except PyMongoError as e:
+                print(f"🔥 Preset change stream interrupted: {e}")
+                self.sleep(self.poll_interval)
+                self._safe_reload()
+
+        print("Preset queue: change streams unavailable, polling instead.")
+        while True:
+            self.sleep(self.poll_interval)
+            self._safe_reload()
+
+    def _safe_reload(self):
+        try:
+            self.reload()
+        except PyMongoError as e:
+            print(f"🔥 Preset reload failed: {e}")
@@ -0,0 +1,211 @@
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Thread, Lock
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+def start_thread(target):
+    thread = Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+class RoundLease:
+    """A renewable lease document in MongoDB. Only the holder drives the game rounds."""
+
+    def __init__(self, collection, name='round_engine', ttl=10):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self):
+        """Takes the lease if it is free or expired, or renews it if we already hold it."""
+        now = datetime.utcnow()
+        try:
+            lease = self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'holder': self.holder}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'holder': self.holder, 'expires_at': now + timedelta(seconds=self.ttl), 'renewed_at': now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds a live lease, so the upsert collided with its document.
+            return False
+        return lease is not None and lease['holder'] == self.holder
+
+    def release(self):
+        """Gives the lease up so another worker can take it without waiting out the TTL."""
+        self.collection.delete_one({'_id': self.name, 'holder': self.holder})
+
+
+class RoundStateChannel:
+    """Round state shared between workers.
+
+    The leader publishes each game's state; every worker reads it through get().
+    With `shared` set, published states are also written to a MongoDB collection
+    that followers poll, so workers that do not run the loops see the same timer,
+    round id and status as the leader.
+    """
+
+    def __init__(self, collection, shared=False, poll_interval=0.25):
+        self.collection = collection
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.publishing = False
+        self._states = {}
+        self._lock = Lock()
+        self._polling = False
+
+    def publish(self, game, state):
+        snapshot = dict(state)
+        with self._lock:
+            self._states[game] = snapshot
+        if self.shared:
+            self.collection.replace_one({'_id': game}, {'_id': game, **snapshot}, upsert=True)
+
+    def get(self, game, default=None):
+        with self._lock:
+            state = self._states.get(game)
+        return dict(state) if state is not None else dict(default or {})
+
+    def start_polling(self, start_task=start_thread, sleep=time.sleep):
+        if not self.shared or self._polling:
+            return
+        self._polling = True
+        self._sleep = sleep
+        start_task(self._poll)
+
+    def _poll(self):
+        while True:
+            if not self.publishing:
+                try:
+                    for doc in self.collection.find():
+                        game = doc.pop('_id')
+                        with self._lock:
+                            self._states[game] = doc
+                except Exception as e:
+                    print(f"🔥 Round state poll failed: {e}")
+            self._sleep(self.poll_interval)
+
+
+class RecentResults:
+    """Newest-first ring buffer of a game's finished rounds.
+
+    The round loop adds each result right after inserting it, so page renders can
+    show recent history without querying the results collection. warm() fills the
+    buffer from Mongo once at startup.
+    """
+
+    def __init__(self, collection, size=10):
+        self.collection = collection
+        self._results = deque(maxlen=size)
+        self._lock = Lock()
+
+    def warm(self):
+        latest = list(self.collection.find({}, {'_id': 0}).sort('timestamp', -1).limit(self._results.maxlen))
+        with self._lock:
+            self._results.clear()
+            self._results.extend(latest)
+
+    def add(self, result):
+        with self._lock:
+            self._results.appendleft({k: v for k, v in result.items() if k != '_id'})
+
+    def latest(self):
+        with self._lock:
+            return list(self._results)
+
+
+class RoundEngine:
+    """Runs the round loops only in the worker that holds the lease.
+
+    A supervisor task renews (or tries to take) the lease every `renew_interval`
+    seconds. When this worker becomes leader it starts the loops. Loops wait out each
+    round phase with wait_until(), which returns False as soon as leadership is lost,
+    and then abandon the round, so two leaders never run rounds at the same time.
+    Leadership also lapses locally once the last successful renewal is `lease.ttl`
+    old, even if the supervisor has not run since.
+    `start_task` and `sleep` default to OS threads; pass socketio.start_background_task
+    and socketio.sleep to match the server's async mode.
+    """
+
+    def __init__(self, lease, channel, loops, renew_interval=None, start_task=start_thread, sleep=time.sleep):
+        self.lease = lease
+        self.channel = channel
+        self.loops = loops
+        self.renew_interval = renew_interval or lease.ttl / 3
+        self.start_task = start_task
+        self.sleep = sleep
+        self.check_interval = min(0.5, self.renew_interval)
+        self._leader = False
+        self._expires = 0.0
+        self._running = set()
+        self._started = False
+        self._stopped = False
+
+    def is_leader(self):
+        return self._leader and time.monotonic() < self._expires
+
+    def wait_until(self, deadline):
+        """Sleeps until a time.monotonic() deadline. Returns False as soon as this worker
+        stops being leader, True once the deadline is reached."""
+        while self.is_leader():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            self.sleep(min(remaining, self.check_interval))
+        return False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.channel.start_polling(self.start_task, self.sleep)
+        self.start_task(self._supervise)
+
+    def stop(self):
+        """Stops renewing and releases the lease, so a graceful restart fails over at once."""
+        self._stopped = True
+        self._leader = False
+        self.channel.publishing = False
+        try:
+            # Filtered on our holder id, so this is a no-op for a follower.
+            self.lease.release()
+        except Exception as e:
+            print(f"🔥 Round engine lease release failed: {e}")
+
+    def _run_loop(self, loop):
+        try:
+            loop()
+        finally:
+            self._running.discard(loop.__name__)
+
+    def _supervise(self):
+        while not self._stopped:
+            attempted_at = time.monotonic()
+            try:
+                leader = self.lease.try_acquire()
+            except Exception as e:
+                print(f"🔥 Round engine lease renewal failed: {e}")
+                leader = False
+            if self._stopped:
+                break
+            if leader != self._leader:
+                print(f"Round engine: {'acquired' if leader else 'lost'} leadership ({self.lease.holder}).")
+            if leader:
+                self._expires = attempted_at + self.lease.ttl
+            self._leader = leader
+            self.channel.publishing = leader
+            if leader:
+                for loop in self.loops:
+                    if loop.__name__ not in self._running:
+                        self._running.add(loop.__name__)
+                        self.start_task(lambda loop=loop: self._run_loop(loop))
+            self.sleep(self.renew_interval)
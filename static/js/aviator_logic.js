@@ -12,6 +12,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const gameStateTimer = document.getElementById('game-state-timer');
     const betButton = document.getElementById('bet-button');
     const betAmountInput = document.getElementById('bet-amount');
+    const autoCashoutInput = document.getElementById('auto-cashout');
     const currentBetDisplay = document.getElementById('current-bet-display');
     const liveBetsContainer = document.getElementById('live-bets-container');
 
@@ -25,6 +26,42 @@ document.addEventListener('DOMContentLoaded', () => {
     let userBetState = 'idle'; // idle, placing, bet_placed, canceling, cashing_out, cashed_out, lost
     let gameState = 'loading';
 
+    // --- Local Flight Curve & Clock Sync ---
+    // When the server sends a flight start_time, the multiplier is drawn locally from the
+    // same curve as app.py; low-rate checkpoints only correct the clock offset.
+    let clockOffset = 0; // server time - client time, in seconds
+    let bestSyncRtt = Infinity;
+    let flightStartTime = null;
+    let flightFrame = null;
+
+    const serverNow = () => Date.now() / 1000 + clockOffset;
+    const multiplierAt = (elapsed) => 1 + 0.05 * elapsed + 0.05 * Math.pow(elapsed, 1.5);
+
+    const syncClock = (samples = 5) => {
+        const clientTime = Date.now() / 1000;
+        socket.emit('aviator_clock_sync', { client_time: clientTime }, (data) => {
+            const receivedAt = Date.now() / 1000;
+            const rtt = receivedAt - clientTime;
+            if (rtt < bestSyncRtt) {
+                bestSyncRtt = rtt;
+                clockOffset = data.server_time - (clientTime + rtt / 2);
+            }
+            if (samples > 1) setTimeout(() => syncClock(samples - 1), 200);
+        });
+    };
+
+    const stopLocalFlight = () => {
+        flightStartTime = null;
+        if (flightFrame) cancelAnimationFrame(flightFrame);
+        flightFrame = null;
+    };
+
+    const drawLocalFlight = () => {
+        if (flightStartTime === null) return;
+        setMultiplier(multiplierAt(Math.max(0, serverNow() - flightStartTime)));
+        flightFrame = requestAnimationFrame(drawLocalFlight);
+    };
+
     // --- Resizing Canvas ---
     const resizeCanvas = () => {
         canvas.width = gameScreen.clientWidth;
@@ -91,12 +128,39 @@ document.addEventListener('DOMContentLoaded', () => {
         currentBetDisplay.innerHTML = content;
     };
 
+    // --- Compact Wire Format ---
+    // With SOCKETIO_WIRE_FORMAT=compact these events arrive as positional arrays (see
+    // wire.py); they are expanded back to the dict form the handlers below expect.
+    const BET_FIELDS = ['id', 'user', 'amount', 'status', 'cashout_multiplier', 'winnings'];
+    const fields = (names, values) => {
+        const result = {};
+        names.forEach((name, i) => { if (values[i] !== undefined && values[i] !== null) result[name] = values[i]; });
+        return result;
+    };
+    const expandBet = (values) => fields(BET_FIELDS, values);
+    const expand = {
+        aviator_multiplier_update: (values) => fields(['multiplier', 'server_time'], values),
+        aviator_state_update: (values) => values[0] === 'waiting'
+            ? fields(['status', 'timer', 'round_id'], values)
+            : fields(['status', 'start_time', 'server_time'], values),
+        aviator_bets_update: ([round_id, bets]) => ({ round_id, bets: bets.map(expandBet) }),
+        aviator_bet_delta: ([op, arg]) => {
+            if (op === 'reset') return { op, round_id: arg };
+            if (op === 'add' || op === 'update') return { op, bet: expandBet(arg) };
+            if (op === 'batch_update') return { op, bets: arg.map(expandBet) };
+            if (op === 'remove') return { op, bet: { id: arg } };
+            return { op };
+        },
+    };
+    const onGameEvent = (event, handler) => socket.on(event, (data) => handler(Array.isArray(data) ? expand[event](data) : data));
+
     // --- Socket.IO Event Handlers ---
-    socket.on('aviator_state_update', (data) => {
+    onGameEvent('aviator_state_update', (data) => {
         gameState = data.status;
         switch (data.status) {
             case 'waiting':
                 userBetState = 'idle';
+                stopLocalFlight();
                 if (planeAnimation) planeAnimation.kill();
                 pathPoints = [];
                 ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -107,14 +171,22 @@ document.addEventListener('DOMContentLoaded', () => {
                 gameStateTimer.textContent = data.timer;
                 updateBetButton('bet');
                 betAmountInput.disabled = false;
+                autoCashoutInput.disabled = false;
                 updateCurrentBetDisplay('idle');
                 break;
 
             case 'flying':
+                if (data.start_time !== undefined) {
+                    // Never let the local clock run behind the server's send time.
+                    if (serverNow() < data.server_time) clockOffset = data.server_time - Date.now() / 1000;
+                    flightStartTime = data.start_time;
+                    drawLocalFlight();
+                }
                 gsap.to(gameStateOverlay, { opacity: 0, duration: 0.5 });
                 gsap.to(multiplierDisplay, { opacity: 1, duration: 0.5, delay: 0.3 });
                 multiplierDisplay.textContent = '1.00x';
                 betAmountInput.disabled = true;
+                autoCashoutInput.disabled = true;
                 if(userBetState === 'bet_placed'){ updateBetButton('cashout'); } 
                 else { updateBetButton('disabled', 'Betting Closed'); }
                 
@@ -135,17 +207,27 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    socket.on('aviator_multiplier_update', (data) => {
-        currentMultiplier = data.multiplier;
+    const setMultiplier = (multiplier) => {
+        currentMultiplier = multiplier;
         multiplierDisplay.textContent = `${currentMultiplier.toFixed(2)}x`;
         if (userBetState === 'bet_placed') {
             const potentialWinnings = parseFloat(betAmountInput.value) * currentMultiplier;
             updateBetButton('cashout', `Cash Out (₹${potentialWinnings.toFixed(2)})`);
         }
+    };
+
+    onGameEvent('aviator_multiplier_update', (data) => {
+        if (data.server_time !== undefined && flightStartTime !== null) {
+            // Checkpoint: pull the local clock forward if it has drifted behind the server.
+            if (serverNow() < data.server_time) clockOffset = data.server_time - Date.now() / 1000;
+            return;
+        }
+        setMultiplier(data.multiplier);
     });
 
     socket.on('aviator_crash', (data) => {
         gameState = 'crashed';
+        stopLocalFlight();
         if (planeAnimation) planeAnimation.kill();
         if (userBetState === 'bet_placed') {
             userBetState = 'lost';
@@ -171,13 +253,16 @@ document.addEventListener('DOMContentLoaded', () => {
         }, 2000);
     });
 
-    socket.on('aviator_bets_update', (bets) => {
+    // --- Live Bets Roster (snapshot on join, deltas afterwards) ---
+    const liveBets = new Map();
+
+    const renderLiveBets = () => {
         liveBetsContainer.innerHTML = '';
-        if (bets.length === 0) {
+        if (liveBets.size === 0) {
             liveBetsContainer.innerHTML = '<p class="text-center text-gray-500">No bets placed yet for this round.</p>';
             return;
         }
-        bets.forEach(bet => {
+        liveBets.forEach(bet => {
             let statusClass = 'bg-gray-800/50';
             let statusText = `₹${bet.amount.toFixed(2)}`;
             if (bet.status === 'cashed_out') {
@@ -191,16 +276,52 @@ document.addEventListener('DOMContentLoaded', () => {
             betElement.innerHTML = `<span class="text-gray-300">${bet.user}</span> <span class="text-sm">${statusText}</span>`;
             liveBetsContainer.appendChild(betElement);
         });
+    };
+
+    // Joining subscribes this socket to the 'aviator' room (round events only go there)
+    // and returns the live bet snapshot. Re-sent on every reconnect.
+    socket.on('connect', () => {
+        socket.emit('aviator_join');
+        bestSyncRtt = Infinity;
+        syncClock();
+    });
+
+    onGameEvent('aviator_bets_update', (snapshot) => {
+        liveBets.clear();
+        snapshot.bets.forEach(bet => liveBets.set(bet.id, bet));
+        renderLiveBets();
+    });
+
+    onGameEvent('aviator_bet_delta', (delta) => {
+        switch (delta.op) {
+            case 'reset': liveBets.clear(); break;
+            case 'add': liveBets.set(delta.bet.id, delta.bet); break;
+            case 'update': if (liveBets.has(delta.bet.id)) liveBets.set(delta.bet.id, { ...liveBets.get(delta.bet.id), ...delta.bet }); break;
+            case 'batch_update': delta.bets.forEach(bet => { if (liveBets.has(bet.id)) liveBets.set(bet.id, { ...liveBets.get(bet.id), ...bet }); }); break;
+            case 'remove': liveBets.delete(delta.bet.id); break;
+            case 'crash': liveBets.forEach(bet => { if (bet.status === 'bet_placed') bet.status = 'lost'; }); break;
+        }
+        renderLiveBets();
+    });
+
+    socket.on('aviator_auto_cashout', (data) => {
+        userBetState = 'cashed_out';
+        updateBetButton('disabled', 'Cashed Out!');
+        updateCurrentBetDisplay('cashed_out', parseFloat(betAmountInput.value), data.multiplier);
+        walletBalanceElement.textContent = (parseFloat(walletBalanceElement.textContent) + data.winnings).toFixed(2);
+        showNotification(`Auto cashed out @ ${data.multiplier.toFixed(2)}x! Won ₹${data.winnings.toFixed(2)}`, 'success');
     });
 
     // --- Main Button Logic ---
     betButton.addEventListener('click', () => {
         if (userBetState === 'idle' && gameState === 'waiting') { // Place Bet
             const amount = betAmountInput.value;
+            const auto_cashout = autoCashoutInput.value || null;
             if (!amount || amount <= 0) { showNotification('Please enter a valid bet amount.', 'error'); return; }
+            if (auto_cashout !== null && !(auto_cashout >= 1.01 && auto_cashout <= 1000)) { showNotification('Auto cash out must be between 1.01x and 1000x.', 'error'); return; }
             updateBetButton('disabled', 'Placing...');
             userBetState = 'placing';
-            fetch('/api/aviator/bet', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ amount }) })
+            fetch('/api/aviator/bet', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ amount, auto_cashout }) })
             .then(res => res.json()).then(data => {
                 if (data.status === 'success') {
                     showNotification(data.message, 'success');
@@ -272,6 +393,8 @@ document.addEventListener('DOMContentLoaded', () => {
          userBetState = current_bet.status;
          betAmountInput.value = current_bet.amount;
          betAmountInput.disabled = true;
+         autoCashoutInput.disabled = true;
+         if (current_bet.auto_cashout) autoCashoutInput.value = current_bet.auto_cashout;
         if (current_bet.status === 'bet_placed') {
             updateCurrentBetDisplay('bet_placed', current_bet.amount);
             updateBetButton('cancel');
@@ -33,21 +33,70 @@ document.addEventListener('DOMContentLoaded', () => {
         const resultsTableBody = document.getElementById('results-table-body');
         const bettingStatus = document.getElementById('betting-status');
         const betButtons = betForm.querySelectorAll('button[type="submit"]');
-        const BETTING_OPEN_UNTIL = 5;
 
-        // Socket.IO Listeners
-        socket.on('timer_update', (data) => {
-            timerElement.textContent = `00:${String(data.timer).padStart(2, '0')}`;
-            roundIdElement.textContent = `#${data.round_id}`;
-            if (data.timer <= BETTING_OPEN_UNTIL) {
-                bettingStatus.textContent = "Betting Closed";
-                bettingStatus.classList.add('text-red-400');
-                betButtons.forEach(btn => btn.disabled = true);
-            } else {
+        // --- Round Countdown ---
+        // The server broadcasts each phase's absolute deadlines once; the countdown and the
+        // betting cut-off are computed locally against the server clock.
+        let clockOffset = 0; // server time - client time, in seconds
+        let colorRound = null;
+        const serverNow = () => Date.now() / 1000 + clockOffset;
+
+        const renderCountdown = () => {
+            if (!colorRound || !colorRound.round_id) return;
+            const now = serverNow();
+            const remaining = Math.max(0, Math.ceil(colorRound.ends_at - now));
+            timerElement.textContent = `00:${String(remaining).padStart(2, '0')}`;
+            const bettingOpen = colorRound.phase === 'open' && now < colorRound.locks_at;
+            if (bettingOpen) {
                 bettingStatus.textContent = "Place your bet below";
                 bettingStatus.classList.remove('text-red-400');
-                betButtons.forEach(btn => btn.disabled = false);
+            } else if (colorRound.next_round_at) {
+                bettingStatus.textContent = `Next round in ${Math.max(0, Math.ceil(colorRound.next_round_at - now))}s`;
+                bettingStatus.classList.add('text-red-400');
+            } else {
+                bettingStatus.textContent = "Betting Closed";
+                bettingStatus.classList.add('text-red-400');
             }
+            betButtons.forEach(btn => btn.disabled = !bettingOpen);
+        };
+
+        const applyRound = (state) => {
+            colorRound = state;
+            if (state.round_id) roundIdElement.textContent = `#${state.round_id}`;
+            renderCountdown();
+        };
+        setInterval(renderCountdown, 250);
+
+        // Socket.IO Listeners
+        // Joining subscribes this socket to the 'color' room (round events only go there)
+        // and returns the current round. Re-sent on every reconnect.
+        socket.on('connect', () => {
+            const sentAt = Date.now() / 1000;
+            socket.emit('color_join', (state) => {
+                const rtt = Date.now() / 1000 - sentAt;
+                clockOffset = state.server_time - (sentAt + rtt / 2);
+                applyRound(state);
+            });
+        });
+
+        socket.on('color_round_update', (state) => {
+            // A broadcast can only arrive after it was sent, so it never moves the clock backwards.
+            if (serverNow() < state.server_time) clockOffset = state.server_time - Date.now() / 1000;
+            applyRound(state);
+        });
+
+        socket.on('color_pool_update', (data) => {
+            if (Array.isArray(data)) {
+                // Compact wire format (wire.py): [round_id, red amount, red bettors, green..., violet...]
+                const [round_id, ...values] = data;
+                const pools = {};
+                ['red', 'green', 'violet'].forEach((color, i) => { pools[color] = { amount: values[2 * i], bettors: values[2 * i + 1] }; });
+                data = { round_id, pools };
+            }
+            Object.entries(data.pools).forEach(([color, pool]) => {
+                const poolElement = document.getElementById(`pool-${color}`);
+                if (poolElement) poolElement.textContent = `₹${pool.amount.toFixed(0)} · ${pool.bettors} players`;
+            });
         });
 
         socket.on('new_result', (data) => {
@@ -71,6 +120,9 @@ document.addEventListener('DOMContentLoaded', () => {
             showNotification(data.message, 'success');
             if (data.balance !== undefined) {
                 walletBalanceElement.textContent = parseFloat(data.balance).toFixed(2);
+            } else if (data.credit !== undefined) {
+                const current = parseFloat(walletBalanceElement.textContent) || 0;
+                walletBalanceElement.textContent = (current + parseFloat(data.credit)).toFixed(2);
             }
         });
 
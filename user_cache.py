@@ -0,0 +1,162 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class UserCache:
+    """Read-through cache of the user profile fields that pages and payment routes need.
+
+    Entries are kept in LRU order, bounded by `maxsize` and expire `ttl` seconds after
+    they were loaded or last patched. Writers patch the entry with the values Mongo
+    returned (wallet balance, status) or invalidate it when they do not know the new
+    value. With `shared` set, a change stream on the users collection applies every
+    other worker's updates too; without change streams (standalone mongod) the TTL is
+    the staleness bound.
+
+    A miss loads outside the lock. If a patch or invalidation for the same user lands
+    while that load is in flight, the loaded document may predate it, so it is returned
+    but not cached.
+    """
+
+    def __init__(self, collection, fields, ttl=30, maxsize=10000, shared=False, start_task=None, sleep=time.sleep):
+        self.collection = collection
+        self.projection = {field: 1 for field in fields}
+        self._roots = {field.split('.')[0] for field in fields}
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.shared = shared
+        self.start_task = start_task
+        self.sleep = sleep
+        self.sync_mode = 'local'
+        self._entries = OrderedDict()
+        self._loads = {}  # user_id -> [loads in flight, written since the first started]
+        self._lock = Lock()
+        self._started = False
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'patches': 0, 'invalidations': 0}
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+
+    def start(self):
+        if self._started or not self.shared:
+            return
+        self._started = True
+        self.sync_mode = 'change_stream'
+        self.start_task(self._sync)
+
+    def get(self, user_id):
+        """Returns a copy of the cached profile, loading it on a miss. None if the user does not exist."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                age = now - entry[0]
+                self._served_age_total += age
+                self._served_age_max = max(self._served_age_max, age)
+                return copy.deepcopy(entry[1])
+            self._stats['expired' if entry else 'misses'] += 1
+            load = self._loads.setdefault(user_id, [0, False])
+            load[0] += 1
+
+        user = None
+        try:
+            user = self.collection.find_one({'_id': user_id}, self.projection)
+        finally:
+            with self._lock:
+                load[0] -= 1
+                if load[0] == 0:
+                    del self._loads[user_id]
+                if user is not None and not load[1]:
+                    self._store(user_id, user, time.monotonic())
+        return user
+
+    def patch(self, user_id, fields):
+        """Applies {dotted.path: value} updates to a cached entry, if there is one."""
+        with self._lock:
+            self._mark_written(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            for path, value in fields.items():
+                _set_path(entry[1], path, value)
+            entry[0] = time.monotonic()
+            self._stats['patches'] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._mark_written(user_id)
+            if self._entries.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for load in self._loads.values():
+                load[1] = True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses'] + stats['expired']
+            stats['size'] = len(self._entries)
+            stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+            stats['served_age_avg_seconds'] = round(self._served_age_total / stats['hits'], 3) if stats['hits'] else 0.0
+            stats['served_age_max_seconds'] = round(self._served_age_max, 3)
+        stats['ttl_seconds'] = self.ttl
+        stats['sync_mode'] = self.sync_mode
+        return stats
+
+    def _mark_written(self, user_id):
+        load = self._loads.get(user_id)
+        if load is not None:
+            load[1] = True
+
+    def _store(self, user_id, user, loaded_at):
+        self._entries[user_id] = [loaded_at, user]
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _apply_change(self, change):
+        user_id = change.get('documentKey', {}).get('_id')
+        if change.get('operationType') != 'update':
+            self.invalidate(user_id)
+            return
+        description = change.get('updateDescription', {})
+        if any(field.split('.')[0] in self._roots for field in description.get('removedFields', [])):
+            self.invalidate(user_id)
+            return
+        updated = {path: value for path, value in description.get('updatedFields', {}).items()
+                   if path.split('.')[0] in self._roots}
+        if updated:
+            self.patch(user_id, updated)
+
+    def _sync(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['update', 'replace', 'delete']}}}]
+        while True:
+            try:
+                with self.collection.watch(pipeline) as stream:
+                    for change in stream:
+                        self._apply_change(change)
+            except OperationFailure:
+                # Change streams need a replica set; entries then live for at most `ttl`.
+                break
+            except PyMongoError as e:
+                print(f"🔥 User cache change stream interrupted: {e}")
+                # Updates made while the stream was down are unknown, so start over.
+                self.clear()
+                self.sleep(1)
+        self.sync_mode = 'ttl_only'
+        print(f"User cache: change streams unavailable, entries expire after {self.ttl}s instead.")
+
+
+def _set_path(doc, path, value):
+    *parents, leaf = path.split('.')
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[leaf] = value
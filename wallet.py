@@ -0,0 +1,64 @@
+from pymongo import ReturnDocument, UpdateOne
+
+
+class WalletService:
+    """Wallet balance changes as single find_one_and_update round trips.
+
+    Debits carry a `wallet.balance >= amount` filter, so concurrent requests cannot
+    overdraw, and both debits and credits return the updated document so callers
+    never re-read the user to report the new balance. With a `cache` (UserCache),
+    writes made outside a session patch or invalidate the cached profile.
+    """
+
+    def __init__(self, users_collection, cache=None):
+        self.users = users_collection
+        self.cache = cache
+
+    def debit(self, user_id, amount, fields=(), session=None):
+        """Subtracts `amount` if the balance covers it. Returns the updated user document
+        (wallet.balance plus any extra `fields`), or None if funds are insufficient or
+        the user does not exist."""
+        user = self.users.find_one_and_update(
+            {'_id': user_id, 'wallet.balance': {'$gte': amount}},
+            {'$inc': {'wallet.balance': -amount}},
+            projection=self._projection(fields),
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        return self._patch_cache(user, session)
+
+    def credit(self, user_id, amount, fields=(), session=None):
+        """Adds `amount` and returns the updated user document, or None if the user does not exist."""
+        user = self.users.find_one_and_update(
+            {'_id': user_id},
+            {'$inc': {'wallet.balance': amount}},
+            projection=self._projection(fields),
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        return self._patch_cache(user, session)
+
+    def credit_many(self, amounts, session=None):
+        """Adds {user_id: amount} credits in one unordered bulk write. Nothing is returned;
+        callers that report balances send the credited amount instead."""
+        if not amounts:
+            return
+        self.users.bulk_write(
+            [UpdateOne({'_id': user_id}, {'$inc': {'wallet.balance': amount}}) for user_id, amount in amounts.items()],
+            ordered=False,
+            session=session
+        )
+        if self.cache and session is None:
+            for user_id in amounts:
+                self.cache.invalidate(user_id)
+
+    def _patch_cache(self, user, session):
+        if user is not None and self.cache and session is None:
+            self.cache.patch(user['_id'], {'wallet.balance': user['wallet']['balance']})
+        return user
+
+    @staticmethod
+    def _projection(fields):
+        projection = {'wallet.balance': 1}
+        projection.update({field: 1 for field in fields})
+        return projection
@@ -0,0 +1,68 @@
+"""Compact positional encodings for the high-frequency Socket.IO events.
+
+With SOCKETIO_WIRE_FORMAT=compact, app.emit() sends these events as arrays instead of
+dicts, and Socket.IO uses its msgpack serializer. The decoders in game_logic.js and
+aviator_logic.js expand an array payload back into the dict form, so the pages read
+both formats. Trailing None values are dropped; the decoders treat a missing
+position as an absent key.
+"""
+COLORS = ('red', 'green', 'violet')
+BET_FIELDS = ('id', 'user', 'amount', 'status', 'cashout_multiplier', 'winnings')
+
+
+def _trim(values):
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def _bet(bet):
+    return _trim([bet.get(field) for field in BET_FIELDS])
+
+
+def _multiplier_update(data):
+    # [multiplier] for a tick, [multiplier, server_time] for a local-curve checkpoint
+    return _trim([data['multiplier'], data.get('server_time')])
+
+
+def _aviator_state_update(data):
+    if data['status'] == 'waiting':
+        return ['waiting', data['timer'], data['round_id']]
+    return _trim([data['status'], data.get('start_time'), data.get('server_time')])
+
+
+def _bets_update(data):
+    return [data['round_id'], [_bet(bet) for bet in data['bets']]]
+
+
+def _bet_delta(data):
+    op = data['op']
+    if op == 'reset':
+        return [op, data['round_id']]
+    if op in ('add', 'update'):
+        return [op, _bet(data['bet'])]
+    if op == 'batch_update':
+        return [op, [_bet(bet) for bet in data['bets']]]
+    if op == 'remove':
+        return [op, data['bet']['id']]
+    return [op]
+
+
+def _pool_update(data):
+    pools = data['pools']
+    return [data['round_id']] + [value for color in COLORS for value in (pools[color]['amount'], pools[color]['bettors'])]
+
+
+ENCODERS = {
+    'aviator_multiplier_update': _multiplier_update,
+    'aviator_state_update': _aviator_state_update,
+    'aviator_bets_update': _bets_update,
+    'aviator_bet_delta': _bet_delta,
+    'color_pool_update': _pool_update,
+}
+
+
+def encode(event, data):
+    """Returns the compact form of an event payload, or the payload unchanged if the event has none."""
+    encoder = ENCODERS.get(event)
+    return encoder(data) if encoder else data